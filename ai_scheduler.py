@@ -0,0 +1,232 @@
+# ai_scheduler.py (AIリクエストのスケジューラー)
+#
+# 1つのプロセスを複数人で使うときに、Gemini への呼び出しをまとめて制御する。
+# - トークンバケット: 1分あたりのリクエスト数・トークン数を上限内に抑える
+# - 再試行: 一時的なエラー (429 / 5xx など) はジッター付きの指数バックオフでやり直す
+# - 優先度: 待ち行列は優先度順 (同じ優先度なら到着順) に処理し、対話的な校正を一括生成より先に通す
+# - 相乗り: 同じキーのリクエストが実行中なら、重複して送らずにその結果を待つ
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# 優先度 (小さいほど先に処理する)
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 10
+
+# 再試行する HTTP ステータスと、google.api_core の例外クラス名
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = {
+    'ResourceExhausted', 'TooManyRequests', 'ServiceUnavailable', 'InternalServerError',
+    'DeadlineExceeded', 'GatewayTimeout', 'BadGateway', 'Aborted',
+}
+QUOTA_ERROR_NAMES = {'ResourceExhausted', 'TooManyRequests'}
+
+
+class _OwnerInterrupted(Exception):
+    pass
+
+
+def _status_code(error):
+    code = getattr(error, 'code', None)
+    code = code() if callable(code) else code
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error):
+    return type(error).__name__ in RETRYABLE_ERROR_NAMES or _status_code(error) in RETRYABLE_STATUS_CODES
+
+
+def is_quota_error(error):
+    return type(error).__name__ in QUOTA_ERROR_NAMES or _status_code(error) == 429
+
+
+def estimate_tokens(text):
+    # 日本語はおおむね1文字1トークン前後になるため、文字数をそのまま見積もりに使う
+    return max(1, len(text))
+
+
+class TokenBucket:
+    # 1分あたり per_minute だけ補充されるバケット (None なら制限なし)
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.level = float(per_minute) if per_minute else 0.0
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        if self.per_minute:
+            self.level = min(float(self.per_minute), self.level + (now - self.updated) * self.per_minute / 60.0)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        # amount を取り出せるまでの秒数 (上限より大きい要求は満杯になった時点で通す)
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.per_minute)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60.0 / self.per_minute
+
+    def take(self, amount, now):
+        if self.per_minute:
+            self._refill(now)
+            self.level -= amount
+
+    def adjust(self, amount):
+        # 見積もりと実際の使用量との差を反映する (負になった分は以後の補充で返済する)
+        if self.per_minute:
+            self.level -= amount
+
+
+class RequestScheduler:
+    def __init__(self, requests_per_minute=15, tokens_per_minute=1_000_000, max_concurrency=4,
+                 max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._condition = threading.Condition()
+        self._queue = []
+        self._sequence = itertools.count()
+        self._running = 0
+        # クォータ超過を受けたら、全体をこの時刻まで止める
+        self._paused_until = 0.0
+        self._inflight = {}
+        self.counters = {'requests': 0, 'retries': 0, 'coalesced': 0, 'failures': 0, 'waited_seconds': 0.0}
+
+    def _acquire(self, priority, tokens):
+        started = time.monotonic()
+        with self._condition:
+            ticket = (priority, next(self._sequence))
+            heapq.heappush(self._queue, ticket)
+            try:
+                while True:
+                    timeout = None
+                    if self._queue[0] == ticket and self._running < self.max_concurrency:
+                        now = time.monotonic()
+                        timeout = max(self._paused_until - now,
+                                      self.requests.wait_time(1, now),
+                                      self.tokens.wait_time(tokens, now))
+                        if timeout <= 0:
+                            break
+                    self._condition.wait(timeout)
+                heapq.heappop(self._queue)
+                now = time.monotonic()
+                self.requests.take(1, now)
+                self.tokens.take(tokens, now)
+                self._running += 1
+                self.counters['requests'] += 1
+                self.counters['waited_seconds'] += now - started
+            except BaseException:
+                # 待機中に中断された場合は待ち行列から外す
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                raise
+            finally:
+                self._condition.notify_all()
+
+    def _release(self):
+        with self._condition:
+            self._running -= 1
+            self._condition.notify_all()
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        # 応答の usage_metadata から分かった実際のトークン数でバケットを補正する
+        if actual_tokens is None:
+            return
+        with self._condition:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def backoff_delay(self, attempt):
+        # full jitter: 0〜(base_delay × 2^attempt) の間で待ち時間を選ぶ
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def retry_delay(self, error, attempt):
+        # 再試行する場合は待ち時間を、しない場合は None を返す
+        if attempt >= self.max_retries or not is_retryable(error):
+            with self._condition:
+                self.counters['failures'] += 1
+            return None
+        delay = self.backoff_delay(attempt)
+        with self._condition:
+            self.counters['retries'] += 1
+            if is_quota_error(error):
+                # クォータ超過は全員に効くため、待ち行列全体を止める
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                self._condition.notify_all()
+        return delay
+
+    @contextmanager
+    def slot(self, priority=PRIORITY_INTERACTIVE, tokens=1):
+        # 実行枠を1つ確保する (ストリーミング生成など、呼び出し側で再試行を制御する場合に使う)
+        self._acquire(priority, tokens)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def call(self, fn, priority=PRIORITY_INTERACTIVE, tokens=1):
+        # fn() を制限内で実行し、一時的なエラーならバックオフして再試行する
+        attempt = 0
+        while True:
+            with self.slot(priority, tokens):
+                try:
+                    return fn()
+                except Exception as e:
+                    delay = self.retry_delay(e, attempt)
+                    if delay is None:
+                        raise
+            time.sleep(delay)
+            attempt += 1
+
+    def submit(self, key, fn, priority=PRIORITY_INTERACTIVE, tokens=1):
+        # 同じ key のリクエストが実行中なら相乗りし、その結果 (または例外) を受け取る
+        while True:
+            with self._condition:
+                future = self._inflight.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = self._inflight[key] = Future()
+                else:
+                    self.counters['coalesced'] += 1
+            if not is_owner:
+                try:
+                    return future.result()
+                except _OwnerInterrupted:
+                    # 実行していた側が中断された (Streamlit の再実行など) ため、自分で送り直す
+                    continue
+            try:
+                result = self.call(fn, priority, tokens)
+            except Exception as e:
+                self._finish(key, future, exception=e)
+                raise
+            except BaseException:
+                self._finish(key, future, exception=_OwnerInterrupted())
+                raise
+            self._finish(key, future, result=result)
+            return result
+
+    def _finish(self, key, future, result=None, exception=None):
+        # 相乗りしている側が結果を受け取るより先に、新しいリクエストを受け付けられるようにする
+        with self._condition:
+            self._inflight.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(result)
+
+    def stats(self):
+        with self._condition:
+            return dict(self.counters, queued=len(self._queue), running=self._running,
+                        inflight=len(self._inflight))
@@ -0,0 +1,215 @@
+# autofix.py (指摘の一括自動修正)
+#
+# 校正結果のうち置換後の文字列 (replacement) を持つものを、テキストへまとめて適用する。
+# - 指摘の (行, 位置, 問題箇所) からテキスト全体でのオフセットを求め、問題箇所と一致するものだけを修正にする
+# - 範囲が重なる修正は、優先度の高いもの (組み込みルール・辞書 → AI) を残し、残りは見送る
+# - 残った修正を位置順に並べ、変更のない部分と置換後の文字列をつなぎ合わせて1回で新しいテキストを作る
+#   (str.replace を繰り返すと修正のたびにテキスト全体を作り直し、後ろの位置もずれていく)
+# 修正前後の差分は、修正の入った行だけから unified diff 形式で作る。
+
+from bisect import bisect_right
+
+from rule_engine import LineIndex
+
+# AIの修正案で、置換ではなく削除を表す書き方と、修正がないことを表す書き方
+_DELETION_WORDS = ('削除', '(削除)', '（削除）')
+_NO_FIX_WORDS = ('', 'なし', '-', '特になし')
+_QUOTES = {'「': '」', '『': '』', '"': '"', '“': '”'}
+
+
+def _priority(edit):
+    # 重なった修正のどれを残すか。組み込みルール・辞書の修正を AI の修正案より優先し、
+    # 同じ出どころの中では長い範囲 (より具体的な修正) → 前にあるものの順にする
+    start, end, _, issue = edit
+    return issue.get('type', '').startswith('AI:'), start - end, start
+
+
+def _unquote(value):
+    if len(value) >= 2 and _QUOTES.get(value[0]) == value[-1]:
+        return value[1:-1]
+    return value
+
+
+def _has_position(issue):
+    # AIの指摘には位置がない (校正結果の DataFrame では -1 になる)
+    position = issue.get('position')
+    return position is not None and position >= 0
+
+
+def _locate(lines, starts, issue):
+    # 指摘の問題箇所がテキストのどこにあるかを (開始, 終了, 置換後) で返す。見つからなければ None
+    line = issue.get('line') or 0
+    text = issue.get('text') or ''
+    replacement = issue.get('replacement')
+    if not isinstance(replacement, str) or not text or not 1 <= line <= len(lines):
+        return None
+    line_text = lines[line - 1]
+    if _has_position(issue):
+        position = issue['position']
+        # 位置の分かる指摘は、その位置に問題箇所がそのまま残っている場合だけ修正する
+        if line_text.startswith(text, position):
+            return starts[line - 1] + position, starts[line - 1] + position + len(text), replacement
+        return None
+    # AIの指摘は位置がないため、行の中から問題箇所を探す (括弧で囲まれていれば外して探し直す)
+    if replacement.strip() in _DELETION_WORDS:
+        replacement = ''
+    for candidate, fixed in ((text, replacement), (_unquote(text), _unquote(replacement))):
+        position = line_text.find(candidate)
+        if candidate and position != -1:
+            return starts[line - 1] + position, starts[line - 1] + position + len(candidate), fixed
+    return None
+
+
+def collect_edits(text, issues, types=None, line_starts=None):
+    # 修正できる指摘を (開始, 終了, 置換後, 指摘) のリストにし、適用できないものは skipped に入れる
+    lines = text.split('\n')
+    starts = line_starts if line_starts is not None else LineIndex(text).starts
+    edits = []
+    skipped = []
+    for issue in issues:
+        if types is not None and issue.get('type') not in types:
+            continue
+        replacement = issue.get('replacement')
+        if not isinstance(replacement, str) or (not _has_position(issue) and replacement.strip() in _NO_FIX_WORDS):
+            continue
+        located = _locate(lines, starts, issue)
+        if located is None or text[located[0]:located[1]] == located[2]:
+            skipped.append({**issue, 'reason': '問題箇所がテキストに見つかりません' if located is None else '変更がありません'})
+            continue
+        edits.append((located[0], located[1], located[2], issue))
+    return edits, skipped
+
+
+def resolve_overlaps(edits, text_length):
+    # 優先度の高い順に受け入れ、すでに受け入れた修正と範囲が重なるものは見送る。
+    # 受け入れた範囲はテキストと同じ長さのバイト列に印を付けて持ち、重なりはその範囲を調べるだけで判定する
+    covered = bytearray(text_length)
+    accepted = []
+    skipped = []
+    seen = set()
+    for edit in sorted(edits, key=_priority):
+        start, end, replacement, issue = edit
+        if (start, end, replacement) in seen:
+            # 同じ修正が複数の指摘から出ている場合は1回だけ適用する
+            continue
+        if covered.find(1, start, end) != -1:
+            skipped.append({**issue, 'reason': 'ほかの修正と範囲が重なっています'})
+            continue
+        seen.add((start, end, replacement))
+        covered[start:end] = b'\x01' * (end - start)
+        accepted.append(edit)
+    accepted.sort(key=lambda edit: edit[0])
+    return accepted, skipped
+
+
+def apply_edits(text, edits):
+    # edits は重なりのない修正を開始位置順に並べたもの。変更のない部分と置換後の文字列を順につなぐ
+    pieces = []
+    cursor = 0
+    for start, end, replacement, _ in edits:
+        pieces.append(text[cursor:start])
+        pieces.append(replacement)
+        cursor = end
+    pieces.append(text[cursor:])
+    return ''.join(pieces)
+
+
+def _format_range(start, stop):
+    # difflib.unified_diff と同じ行範囲の書き方
+    length = stop - start
+    if length == 1:
+        return f"{start + 1}"
+    return f"{start + 1 if length else start},{length}"
+
+
+def _split_lines(text):
+    # splitlines(keepends=True) と同じく改行を残して行に分ける (末尾が改行で終わるなら、その後ろの空行は作らない)。
+    # 行番号を LineIndex と合わせるため、区切りは '\n' だけにする
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _diff_line(prefix, line):
+    # 改行で終わらない最後の行には、patch / git apply が読む「改行なし」の印を付ける
+    if line.endswith('\n'):
+        return prefix + line[:-1]
+    return f"{prefix}{line}\n\\ No newline at end of file"
+
+
+def _changed_blocks(text, starts, edits):
+    # 修正が入る行をまとめ、(旧テキストの開始行, 終了行, 旧行のリスト, 新行のリスト) を行順に返す。
+    # どの行が変わるかは修正の位置から分かるため、テキスト全体を比べ直す必要はない
+    groups = []
+    for edit in edits:
+        first = bisect_right(starts, edit[0]) - 1
+        # 行末の改行まで置き換える修正は、次の行もつなげて変えるため、終了位置の行までを含める
+        last = bisect_right(starts, edit[1]) - 1
+        # 隣り合う行の修正も1つにまとめる (削除行・追加行を続けて並べるため)
+        if groups and first <= groups[-1][1] + 1:
+            groups[-1][1] = max(groups[-1][1], last)
+            groups[-1][2].append(edit)
+        else:
+            groups.append([first, last, [edit]])
+    for first, last, group in groups:
+        # 行は末尾の改行まで含めて比べる (最後の行の改行の有無も差分に出すため)
+        offset = starts[first]
+        end = starts[last + 1] if last + 1 < len(starts) else len(text)
+        segment = text[offset:end]
+        fixed = apply_edits(segment, [(start - offset, stop - offset, replacement, issue)
+                                      for start, stop, replacement, issue in group])
+        old_lines = _split_lines(segment)
+        yield first, first + len(old_lines), old_lines, _split_lines(fixed)
+
+
+def unified_diff(text, edits, filename='台本.txt', context=3, line_starts=None):
+    # apply_edits で text に edits を適用した結果との差分を、unified diff 形式で返す
+    starts = line_starts if line_starts is not None else LineIndex(text).starts
+    hunks = []
+    shift = 0
+    for i1, i2, old_lines, new_lines in _changed_blocks(text, starts, edits):
+        change = (i1, i2, i1 + shift, old_lines, new_lines)
+        shift += len(new_lines) - len(old_lines)
+        # 前の変更との間の変わらない行が前後の文脈 (context 行ずつ) に収まるなら、同じハンクにする
+        if hunks and i1 - hunks[-1][-1][1] <= context * 2:
+            hunks[-1].append(change)
+        else:
+            hunks.append([change])
+    if not hunks:
+        return ''
+    # 文脈の行は改行まで含めてテキストから切り出す (末尾が改行で終わるなら、その後ろの空行は数えない)
+    line_count = len(starts) - (starts[-1] == len(text))
+
+    def context_lines(first, stop):
+        return _split_lines(text[starts[first]:starts[stop] if stop < len(starts) else len(text)]) if first < stop else []
+
+    output = [f"--- a/{filename}", f"+++ b/{filename}"]
+    for hunk in hunks:
+        old_start = max(0, hunk[0][0] - context)
+        old_stop = min(line_count, hunk[-1][1] + context)
+        new_start = hunk[0][2] - (hunk[0][0] - old_start)
+        new_stop = old_stop + hunk[-1][2] - hunk[-1][0] + len(hunk[-1][4]) - len(hunk[-1][3])
+        output.append(f"@@ -{_format_range(old_start, old_stop)} +{_format_range(new_start, new_stop)} @@")
+        cursor = old_start
+        for i1, i2, _, old_lines, new_lines in hunk:
+            output.extend(_diff_line(' ', line) for line in context_lines(cursor, i1))
+            output.extend(_diff_line('-', line) for line in old_lines)
+            output.extend(_diff_line('+', line) for line in new_lines)
+            cursor = i2
+        output.extend(_diff_line(' ', line) for line in context_lines(cursor, old_stop))
+    return '\n'.join(output) + '\n'
+
+
+def apply_fixes(text, issues, types=None, filename='台本.txt'):
+    # types を指定すると、その種類の指摘だけを修正する
+    starts = LineIndex(text).starts
+    edits, skipped = collect_edits(text, issues, types, line_starts=starts)
+    accepted, overlapping = resolve_overlaps(edits, len(text))
+    return {
+        'text': apply_edits(text, accepted),
+        'diff': unified_diff(text, accepted, filename, line_starts=starts),
+        'applied': [edit[3] for edit in accepted],
+        'skipped': skipped + overlapping,
+    }
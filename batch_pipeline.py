@@ -0,0 +1,326 @@
+# batch_pipeline.py (台本の一括生成パイプライン)
+#
+# 使い方:
+#   GEMINI_API_KEY=... python batch_pipeline.py jobs.csv --output-dir output/weekly --concurrency 4
+#
+# CSV / JSONL の各行 (genre, theme, length_minutes) について
+# プロット生成 → 台本生成 → 校正 を行い、段階ごとの成果物を出来た順にディスクへ書き出す。
+# 同時に処理する行数は concurrency 件までに抑え、各行は別々の段階を並行して進む。
+#
+# 出力ディレクトリの構成:
+#   <行ID>/input.json    入力 (指紋付き)
+#   <行ID>/plot.txt      生成されたプロット
+#   <行ID>/script.txt    生成された台本
+#   <行ID>/issues.jsonl  校正結果
+#   checkpoint.jsonl     完了した行の記録 (追記のみ)
+# 途中で止まっても、同じ出力ディレクトリで再実行すれば完了済みの行は飛ばし、
+# 途中まで進んだ行も書き出し済みの段階から再開する。
+
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from ai_scheduler import PRIORITY_BULK, RequestScheduler
+from proofreading_core import SECTION_GENERATION_MINUTES, AiAssistant, ScriptProofreadingTool
+from response_cache import ResponseCache
+from tracing import tracer
+
+DEFAULT_LENGTH_MINUTES = 8
+CHECKPOINT_NAME = 'checkpoint.jsonl'
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'ai_responses.sqlite3')
+
+
+# --- 入力の読み込み ---
+def parse_jobs(text, input_format):
+    # input_format は 'csv' または 'jsonl'。id 列がなければ行番号を ID にする。
+    # ID は出力先のディレクトリ名とチェックポイントのキーになるため、
+    # ファイル名に使えない文字を _ に置き換えたあとで重なる ID があれば ValueError を送出する
+    if input_format == 'jsonl':
+        rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        rows = list(csv.DictReader(io.StringIO(text)))
+    jobs = []
+    # 置き換え後の ID → (最初に使った行番号, 元の ID)
+    first_rows = {}
+    for index, row in enumerate(rows, 1):
+        if not isinstance(row, dict):
+            raise ValueError(f"{index} 行目: JSON のオブジェクト ({{\"genre\": ..., \"theme\": ...}} の形) ではありません")
+        job_id = str(row.get('id') or '').strip() or f"{index:05d}"
+        length = str(row.get('length_minutes') or '').strip()
+        safe_id = re.sub(r'[^\w.-]', '_', job_id)
+        if safe_id in ('.', '..'):
+            raise ValueError(f"{index} 行目: ID「{job_id}」は出力先のディレクトリ名に使えません")
+        if safe_id in first_rows:
+            first_index, first_id = first_rows[safe_id]
+            if first_id == job_id:
+                reason = f"{first_index} 行目と重複しています"
+            else:
+                reason = f"{first_index} 行目の「{first_id}」と同じ出力先「{safe_id}」になります"
+            raise ValueError(f"{index} 行目: ID「{job_id}」は{reason}。ID が重ならないように直してください")
+        first_rows[safe_id] = (index, job_id)
+        jobs.append({
+            'id': safe_id,
+            'genre': str(row.get('genre') or '').strip(),
+            'theme': str(row.get('theme') or '').strip(),
+            'length_minutes': length or DEFAULT_LENGTH_MINUTES,
+        })
+    return jobs
+
+
+def load_jobs(path):
+    input_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+    # Excel で保存した CSV の BOM も取り除く
+    with open(path, encoding='utf-8-sig') as f:
+        return parse_jobs(f.read(), input_format)
+
+
+def job_fingerprint(job):
+    # 入力が変わった行は、完了済みでも作り直す
+    payload = json.dumps([job['genre'], job['theme'], str(job['length_minutes'])], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+# --- ディスクへの書き出し ---
+def _write_atomic(path, text):
+    # 書きかけのファイルが残らないよう、一時ファイルに書いてから置き換える
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def _read_text(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def read_checkpoint(output_dir):
+    # 行IDごとの最新の記録を返す (最後の行が書きかけでも読み飛ばす)
+    records = {}
+    path = os.path.join(output_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return records
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            records[record['id']] = record
+    return records
+
+
+class BatchPipeline:
+    def __init__(self, assistant, tool, output_dir, concurrency=4, ai_check=False):
+        self.assistant = assistant
+        self.tool = tool
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self.ai_check = ai_check
+        self._checkpoint_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def stop(self):
+        # 実行中の行は最後まで進め、新しい行には着手しない
+        self._stop.set()
+
+    def _record(self, record):
+        with self._checkpoint_lock:
+            with open(os.path.join(self.output_dir, CHECKPOINT_NAME), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    def _stage(self, job_dir, name, resume, produce):
+        # 書き出し済みの成果物があればそれを使い、なければ生成してすぐに書き出す
+        path = os.path.join(job_dir, name)
+        with tracer.span(f"batch:{os.path.splitext(name)[0]}") as attrs:
+            if resume:
+                text = _read_text(path)
+                if text:
+                    attrs['resumed'] = True
+                    return text
+            text = produce()
+            _write_atomic(path, text)
+            return text
+
+    def generate_script(self, plot, length_minutes):
+        # 長尺の台本は起承転結のパートごとに並行して生成する
+        if length_minutes >= SECTION_GENERATION_MINUTES:
+            prompts = self.assistant.build_section_prompts(plot, length_minutes)
+            if prompts is not None:
+                return ''.join(self.assistant._stream_sections(prompts, priority=PRIORITY_BULK))
+        return self.assistant._request(self.assistant.build_script_prompt(plot, length_minutes), priority=PRIORITY_BULK)
+
+    def run_job(self, job):
+        started = time.perf_counter()
+        fingerprint = job_fingerprint(job)
+        record = {'id': job['id'], 'fingerprint': fingerprint, 'genre': job['genre'], 'theme': job['theme'],
+                  'length_minutes': job['length_minutes']}
+        try:
+            if not job['genre'] or not job['theme']:
+                raise ValueError("genre と theme は必須です")
+            length_minutes = int(job['length_minutes'])
+            job_dir = os.path.join(self.output_dir, job['id'])
+            os.makedirs(job_dir, exist_ok=True)
+            # 前回と同じ入力のときだけ、書き出し済みの段階を再利用する
+            previous_input = _read_text(os.path.join(job_dir, 'input.json'))
+            resume = previous_input is not None and json.loads(previous_input).get('fingerprint') == fingerprint
+            _write_atomic(os.path.join(job_dir, 'input.json'), json.dumps(dict(record), ensure_ascii=False, indent=2))
+
+            request = self.assistant._request
+            plot = self._stage(job_dir, 'plot.txt', resume, lambda: request(
+                self.assistant.build_plot_prompt(job['genre'], job['theme']), priority=PRIORITY_BULK))
+            script = self._stage(job_dir, 'script.txt', resume, lambda: self.generate_script(plot, length_minutes))
+
+            warnings = []
+            issues = self.tool.perform_basic_check(script)
+            estimate, length_issue = self.tool.estimate_length(script, length_minutes)
+            if length_issue is not None:
+                issues.append(length_issue)
+            if self.ai_check:
+                issues.extend(self.tool.perform_ai_check(script, assistant=self.assistant, on_error=warnings.append,
+                                                         priority=PRIORITY_BULK))
+            _write_atomic(os.path.join(job_dir, 'issues.jsonl'),
+                          ''.join(json.dumps(issue, ensure_ascii=False) + '\n' for issue in issues))
+            record.update(status='done', script_path=os.path.join(job['id'], 'script.txt'), issue_count=len(issues),
+                          error_count=sum(1 for issue in issues if issue.get('severity') == 'error'),
+                          script_chars=len(script), estimated_minutes=round(estimate['seconds'] / 60.0, 1),
+                          warnings=warnings)
+        except Exception as e:
+            record.update(status='failed', error=str(e))
+        record['elapsed'] = round(time.perf_counter() - started, 3)
+        self._record(record)
+        return record
+
+    def run(self, jobs, on_progress=None, on_record=None):
+        # on_progress / on_record は呼び出し元のスレッドから呼ぶ (Streamlit の描画をそのまま行える)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self._stop.clear()
+        finished = read_checkpoint(self.output_dir)
+        todo = []
+        skipped = 0
+        for job in jobs:
+            previous = finished.get(job['id'])
+            if previous and previous.get('status') == 'done' and previous.get('fingerprint') == job_fingerprint(job):
+                skipped += 1
+            else:
+                todo.append(job)
+
+        progress = {'total': len(jobs), 'skipped': skipped, 'done': 0, 'failed': 0, 'running': 0,
+                    'elapsed': 0.0, 'jobs_per_minute': 0.0, 'eta_seconds': None}
+        started = time.perf_counter()
+
+        def report():
+            elapsed = time.perf_counter() - started
+            completed = progress['done'] + progress['failed']
+            remaining = len(todo) - completed
+            progress['elapsed'] = elapsed
+            # 今回処理した行の速度から残り時間を見積もる (再開時に飛ばした行は含めない)
+            progress['jobs_per_minute'] = completed * 60.0 / elapsed if completed and elapsed > 0 else 0.0
+            progress['eta_seconds'] = remaining * elapsed / completed if completed else None
+            if on_progress is not None:
+                on_progress(dict(progress))
+
+        report()
+        pending = iter(todo)
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            while True:
+                # 同時に進める行を concurrency 件までに抑え、終わった分だけ次の行を投入する
+                while len(in_flight) < self.concurrency and not self._stop.is_set():
+                    job = next(pending, None)
+                    if job is None:
+                        break
+                    in_flight.add(executor.submit(self.run_job, job))
+                progress['running'] = len(in_flight)
+                if not in_flight:
+                    break
+                completed, in_flight = wait(in_flight, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in completed:
+                    record = future.result()
+                    progress['done' if record['status'] == 'done' else 'failed'] += 1
+                    if on_record is not None:
+                        on_record(record)
+                report()
+        progress['running'] = 0
+        report()
+        return progress
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return '--:--'
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    return f"{hours}:{rest // 60:02d}:{rest % 60:02d}" if hours else f"{rest // 60:02d}:{rest % 60:02d}"
+
+
+def format_progress(progress):
+    completed = progress['done'] + progress['failed'] + progress['skipped']
+    return (f"{completed}/{progress['total']} 件 (完了 {progress['done']} / 失敗 {progress['failed']} / "
+            f"スキップ {progress['skipped']} / 実行中 {progress['running']}) "
+            f"{progress['jobs_per_minute']:.1f} 件/分 ・ 経過 {format_duration(progress['elapsed'])} ・ "
+            f"残り {format_duration(progress['eta_seconds'])}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='CSV / JSONL のジャンル・テーマから、プロット・台本・校正結果を一括生成します。')
+    parser.add_argument('jobs', help='genre, theme, length_minutes (任意で id) 列を持つ CSV または JSONL')
+    parser.add_argument('--output-dir', '-o', required=True, help='成果物とチェックポイントの出力先 (再実行すると続きから再開)')
+    parser.add_argument('--concurrency', type=int, default=4, help='同時に処理する行数 (既定: 4)')
+    parser.add_argument('--ai-check', action='store_true', help='基本チェックに加えてAIチェックも行う')
+    parser.add_argument('--api-key', default=os.environ.get('GEMINI_API_KEY'), help='Gemini APIキー (既定: 環境変数 GEMINI_API_KEY)')
+    parser.add_argument('--requests-per-minute', type=int, default=15, help='1分あたりのリクエスト数の上限 (既定: 15)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help='AI応答キャッシュの保存先')
+    parser.add_argument('--trace', metavar='PATH', help='処理時間・トークン数の計測結果を JSONL で書き出す')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        jobs = load_jobs(args.jobs)
+    except ValueError as e:
+        print(f"ジョブファイルを読み込めませんでした: {e}", file=sys.stderr)
+        return 2
+    scheduler = RequestScheduler(requests_per_minute=args.requests_per_minute, max_concurrency=args.concurrency)
+    try:
+        assistant = AiAssistant(args.api_key, cache=ResponseCache(args.cache), scheduler=scheduler)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    pipeline = BatchPipeline(assistant, ScriptProofreadingTool(), args.output_dir,
+                             concurrency=args.concurrency, ai_check=args.ai_check)
+
+    def on_record(record):
+        if record['status'] == 'failed':
+            print(f"失敗しました: {record['id']}: {record['error']}", file=sys.stderr)
+
+    try:
+        progress = pipeline.run(jobs, on_progress=lambda p: print('\r' + format_progress(p), end='', file=sys.stderr),
+                                on_record=on_record)
+    except KeyboardInterrupt:
+        # 完了した行はチェックポイントに記録済みのため、再実行すれば続きから再開できる
+        print("\n中断しました。同じ出力先で再実行すると続きから再開します。", file=sys.stderr)
+        return 130
+    finally:
+        if args.trace:
+            _write_atomic(args.trace, tracer.export_jsonl())
+    print(file=sys.stderr)
+    return 1 if progress['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
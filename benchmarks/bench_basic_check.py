@@ -0,0 +1,91 @@
+# bench_basic_check.py (基本チェックの before / after ベンチマーク)
+#
+# 実行方法: python benchmarks/bench_basic_check.py [行数 ...]
+# 従来の「行 × パターン」ループとコンパイル済みルールエンジンの
+# 所要時間を比較し、出力が完全に一致することも確認する。
+# 括弧の対応は台本の解析 (script_parser) で行うため、比較はルールの照合だけを対象にし、
+# 解析を含めた校正ツール全体の所要時間は別の列に出す。
+
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from proofreading_core import ScriptProofreadingTool
+from rule_engine import BASIC_PATTERNS, CompiledRuleSet, LineIndex
+from script_parser import parse_brackets
+
+# 指摘を含まない行
+CLEAN_LINES = [
+    'N: これはイッチが実際に体験した話である。',
+    'イッチ: 今日は会社でちょっとした事件があったんだ',
+    '名無しA: kwsk',
+    '名無しB: はよ',
+    'イッチ: 「まあ、なんとかなるやろ」って思ってた',
+    '【画像: 会社の休憩室】',
+    '名無しC: それは草',
+    'N: しかし、事態は思わぬ方向へと進んでいく。',
+]
+
+# 指摘を含む行
+ISSUE_LINES = [
+    'イッチ: 今日会社で大変な事があったんだがｗｗｗ',
+    '名無しB: それってどういう事？？',
+    'イッチ: 上司が「お前なら出来るだろ、って言ってきて',
+    '名無しC: そんなの見れるわけないだろ。。',
+    '【テロップ: 衝撃の事実！！】',
+    'N: その後、イッチは  思いもよらない行動に出る。',
+]
+
+
+def legacy_basic_check(text):
+    # 変更前の perform_basic_check のうち、ルールの照合と同じ処理
+    results = []
+    lines = text.split('\n')
+    for line_idx, line in enumerate(lines, 1):
+        for pattern_info in BASIC_PATTERNS:
+            for match in re.finditer(pattern_info['pattern'], line):
+                results.append({'type': pattern_info['type'], 'line': line_idx, 'position': match.start(), 'text': match.group(), 'message': pattern_info['message'], 'severity': 'suggestion'})
+    return results
+
+
+def make_script(num_lines, issue_ratio=0.1, seed=0):
+    rng = random.Random(seed)
+    return '\n'.join(
+        rng.choice(ISSUE_LINES if rng.random() < issue_ratio else CLEAN_LINES)
+        for _ in range(num_lines))
+
+
+def best_of(func, text, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main(argv):
+    sizes = [int(arg) for arg in argv] or [1000, 20000, 100000]
+    rule_set = CompiledRuleSet(BASIC_PATTERNS)
+    tool = ScriptProofreadingTool()
+    print(f"{'行数':>8} {'指摘数':>8} {'before (s)':>12} {'after (s)':>12} {'倍率':>8} {'解析 (s)':>10} {'全体 (s)':>10}")
+    for size in sizes:
+        text = make_script(size)
+        before, expected = best_of(legacy_basic_check, text)
+        after, actual = best_of(rule_set.check, text)
+        # 自動修正用の replacement は従来の出力にないため、比較から除く
+        if [{key: value for key, value in r.items() if key != 'replacement'} for r in actual] != expected:
+            print(f"出力が一致しません (行数: {size})")
+            return 1
+        parse, _ = best_of(lambda t: parse_brackets(t, LineIndex(t).starts), text)
+        total, _ = best_of(tool.check_lines, text)
+        print(f"{size:>8} {len(actual):>8} {before:>12.4f} {after:>12.4f} {before / after:>7.1f}x {parse:>10.4f} {total:>10.4f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,84 @@
+# bench_startup.py (起動時間・再実行時間のベンチマーク)
+#
+# 実行方法: python benchmarks/bench_startup.py [--update]
+# 次の時間を計測し、startup_budget.json の予算を超えた場合は終了コード 1 を返す。
+# - core_import_ms: proofreading_core の初回 import (別プロセスで計測)
+# - app_cold_run_ms: アプリの初回実行 (APIキー未入力)
+# - app_first_key_run_ms: APIキー入力直後の実行 (AIクライアントの作成を含む)
+# - app_rerun_ms: その後の再実行1回あたりの中央値
+# --update を付けると、計測値の2倍を新しい予算として保存する (手で丸めてからコミットする)。
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUDGET_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'startup_budget.json')
+RERUNS = 10
+
+
+def measure_core_import(repeat=5):
+    code = 'import time; t = time.perf_counter(); import proofreading_core; print(time.perf_counter() - t)'
+    samples = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        samples.append(float(output) * 1000)
+    return statistics.median(samples)
+
+
+def timed_run(app_test):
+    start = time.perf_counter()
+    app_test.run()
+    elapsed = (time.perf_counter() - start) * 1000
+    if app_test.exception:
+        raise RuntimeError(app_test.exception[0].value)
+    return elapsed
+
+
+def measure_app():
+    warnings.filterwarnings('ignore')
+    from streamlit.testing.v1 import AppTest
+
+    app_test = AppTest.from_file(os.path.join(ROOT, 'proofreading_tool.py'), default_timeout=60)
+    cold = timed_run(app_test)
+    app_test.sidebar.text_input[0].set_value('benchmark-dummy-key')
+    first_key = timed_run(app_test)
+    reruns = [timed_run(app_test) for _ in range(RERUNS)]
+    return cold, first_key, statistics.median(reruns)
+
+
+def main(argv):
+    cold, first_key, rerun = measure_app()
+    measured = {
+        'core_import_ms': measure_core_import(),
+        'app_cold_run_ms': cold,
+        'app_first_key_run_ms': first_key,
+        'app_rerun_ms': rerun,
+    }
+
+    if '--update' in argv:
+        with open(BUDGET_PATH, 'w', encoding='utf-8') as f:
+            json.dump({name: round(value * 2) for name, value in measured.items()}, f, indent=2)
+            f.write('\n')
+        print(f"予算を更新しました: {BUDGET_PATH}")
+
+    with open(BUDGET_PATH, encoding='utf-8') as f:
+        budget = json.load(f)
+    over = False
+    print(f"{'項目':<24} {'計測 (ms)':>10} {'予算 (ms)':>10}")
+    for name, value in measured.items():
+        limit = budget.get(name)
+        mark = ''
+        if limit is not None and value > limit:
+            mark = '  << 予算超過'
+            over = True
+        print(f"{name:<24} {value:>10.1f} {limit if limit is not None else '-':>10}{mark}")
+    return 1 if over else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
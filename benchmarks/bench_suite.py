@@ -0,0 +1,309 @@
+# bench_suite.py (校正ツール全体のベンチマーク)
+#
+# 実行方法: python benchmarks/bench_suite.py [--sizes 1000 10000 ...] [--full] [--components basic_check ...]
+#                                            [--update] [--json 結果.json] [--stub-latency-ms 20] [--stub-jitter-ms 10]
+# 合成した2ch風台本 (synthetic_scripts) を使い、処理ごとにスループット・p50/p99 の所要時間・ピークメモリを計測する。
+# AIの呼び出しは Gemini のスタブ (genai_stub) に差し替えるため、ネットワークもAPIキーも使わない。
+# - basic_check: 基本チェック全体 (指摘の種類ごとの件数が合成時の想定と一致することも確認する)
+# - basic_check_incremental: 1行だけ書き換えた台本の再チェック (前回の結果を使う差分チェック)
+# - parse_ai_response: スタブが返す定型の応答の解析
+# - ai_check: AIチェック全体 (チャンク分割・並列の問い合わせ・応答の解析)。所要時間は1回の問い合わせあたり
+# - autofix: 基本チェックの指摘の一括修正と差分の作成
+# - script_stream: 台本のストリーミング生成 (行数によらないため1回だけ計測し、p50 に最初のチャンクまでの時間を出す)
+# 結果は suite_baseline.json の基準値と比べ、スループットが基準の 1/tolerance を下回るか、
+# 所要時間・メモリが基準の tolerance 倍 (＋わずかな余裕) を超えたら「回帰」として終了コード 1 を返す。
+# --update を付けると、計測値を新しい基準値として保存する。
+# 1,000,000 行は時間がかかるため --full を付けたときだけ計測する。
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ai_scheduler import RequestScheduler
+from autofix import apply_fixes
+from genai_stub import StubGenerativeModel, install_stub
+from proofreading_core import AiAssistant, ScriptProofreadingTool, split_into_chunks
+from synthetic_scripts import make_synthetic_script
+from tracing import tracer
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'suite_baseline.json')
+DEFAULT_SIZES = [1000, 10000, 100000]
+FULL_SIZE = 1000000
+DEFAULT_TOLERANCE = 2.0
+# 基準値が小さいときに揺らぎだけで回帰と判定しないための余裕 (p50 / p99 はミリ秒、ピークは MB)
+SLACK = {'p50_ms': 1.0, 'p99_ms': 2.0, 'peak_mb': 1.0}
+INCREMENTAL_EDITS = 100
+MIN_PARSE_CALLS = 200
+STREAM_RUNS = 10
+
+
+def _percentiles(samples):
+    ordered = sorted(samples)
+    return (round(ordered[len(ordered) // 2] * 1000, 3),
+            round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))] * 1000, 3))
+
+
+def _repeat_for(size):
+    # 小さい台本は回数を増やしてばらつきを抑える
+    return max(1, min(20, 200000 // size))
+
+
+def _timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def _peak_mb(function):
+    # 計測対象の処理の中で確保されたメモリの最大量 (入力の台本は含まない)
+    tracemalloc.start()
+    try:
+        function()
+        return round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 2)
+    finally:
+        tracemalloc.stop()
+
+
+def _make_assistant():
+    # スタブの中では待つだけなので、流量制限はかけずに同時実行数だけを本番と同じにする
+    return AiAssistant('benchmark-stub', cache=None, use_cache=False,
+                       scheduler=RequestScheduler(requests_per_minute=None, tokens_per_minute=None, max_concurrency=4))
+
+
+# --- 処理ごとの計測 (どれも (計測値の辞書, ピークメモリを測るための関数) を返す) ---
+def bench_basic_check(script, options):
+    tool = ScriptProofreadingTool()
+    text, expected = script['text'], script['expected']
+    found = Counter(r['type'] for r in tool.perform_basic_check(text))
+    if found != expected:
+        raise AssertionError(f"基本チェックの指摘数が想定と一致しません: 想定 {dict(expected)} / 結果 {dict(found)}")
+    samples = _timed(lambda: tool.perform_basic_check(text), _repeat_for(script['lines']))
+    p50, p99 = _percentiles(samples)
+    median = statistics.median(samples)
+    return {'throughput': round(script['lines'] / median), 'unit': '行/s', 'p50_ms': p50, 'p99_ms': p99,
+            'mb_per_s': round(len(text.encode('utf-8')) / 1024 / 1024 / median, 2)}, lambda: tool.perform_basic_check(text)
+
+
+def bench_basic_check_incremental(script, options):
+    tool = ScriptProofreadingTool()
+    lines = script['text'].split('\n')
+    # 書き換える行は毎回同じになるよう、行数から決める
+    targets = [(index * 7919) % len(lines) for index in range(INCREMENTAL_EDITS)]
+
+    def run(samples):
+        state = {}
+        tool.perform_basic_check('\n'.join(lines), state)
+        edited = list(lines)
+        for target in targets:
+            edited[target] += '出来る'
+            text = '\n'.join(edited)
+            start = time.perf_counter()
+            tool.perform_basic_check(text, state)
+            samples.append(time.perf_counter() - start)
+
+    samples = []
+    run(samples)
+    p50, p99 = _percentiles(samples)
+    return {'throughput': round(len(samples) / sum(samples)), 'unit': '回/s', 'p50_ms': p50, 'p99_ms': p99}, lambda: run([])
+
+
+def bench_parse_ai_response(script, options):
+    tool = ScriptProofreadingTool()
+    # 台本をAIチェックと同じチャンクに分け、スタブが返す応答を先に作っておく
+    model = StubGenerativeModel('benchmark-stub', issues_per_chunk=options.stub_issues)
+    chunks = split_into_chunks(script['text'].split('\n'), tool.AI_CHUNK_LINES, tool.AI_CHUNK_OVERLAP)
+    responses = []
+    for chunk in chunks:
+        prompt = tool.build_ai_prompt(chunk)
+        responses.append(model.proofreading_response(prompt, model._rng(prompt)))
+    responses = responses * max(1, -(-MIN_PARSE_CALLS // len(responses)))
+    issues = 0
+    samples = []
+    for response in responses:
+        start = time.perf_counter()
+        issues += len(tool.parse_ai_response(response))
+        samples.append(time.perf_counter() - start)
+    p50, p99 = _percentiles(samples)
+    return ({'throughput': round(issues / sum(samples)), 'unit': '件/s', 'p50_ms': p50, 'p99_ms': p99},
+            lambda: [tool.parse_ai_response(response) for response in responses])
+
+
+def bench_ai_check(script, options):
+    tool = ScriptProofreadingTool()
+    text = script['text']
+    with install_stub(latency=options.stub_latency_ms / 1000, jitter=options.stub_jitter_ms / 1000,
+                      issues_per_chunk=options.stub_issues) as models:
+        assistant = _make_assistant()
+        tracer.reset()
+        start = time.perf_counter()
+        results = tool.perform_ai_check(text, assistant=assistant)
+        elapsed = time.perf_counter() - start
+        calls = {row['name']: row for row in tracer.span_summary()}['gemini']
+        if not results or models[0].calls != calls['count']:
+            raise AssertionError(f"AIチェックの結果が想定と異なります: 指摘 {len(results)} 件 / 呼び出し {models[0].calls} 回")
+        peak = _peak_mb(lambda: tool.perform_ai_check(text, assistant=_make_assistant()))
+    return {'throughput': round(script['lines'] / elapsed), 'unit': '行/s', 'p50_ms': calls['p50_ms'],
+            'p99_ms': calls['p99_ms'], 'calls': calls['count'], 'peak_mb': peak}, None
+
+
+def bench_autofix(script, options):
+    tool = ScriptProofreadingTool()
+    text = script['text']
+    issues = tool.perform_basic_check(text)
+    fixed = apply_fixes(text, issues)
+    if not fixed['applied']:
+        raise AssertionError('一括修正で適用された修正がありません')
+    samples = _timed(lambda: apply_fixes(text, issues), _repeat_for(script['lines']))
+    p50, p99 = _percentiles(samples)
+    return ({'throughput': round(script['lines'] / statistics.median(samples)), 'unit': '行/s', 'p50_ms': p50, 'p99_ms': p99},
+            lambda: apply_fixes(text, issues))
+
+
+def bench_script_stream(options):
+    with install_stub(latency=options.stub_latency_ms / 1000, jitter=options.stub_jitter_ms / 1000) as models:
+        first_chunks = []
+        totals = []
+        characters = 0
+        for run in range(STREAM_RUNS):
+            assistant = _make_assistant()
+            start = time.perf_counter()
+            first = None
+            # プロットを毎回変えて、応答の揺らぎも含めて計測する
+            for chunk in assistant.create_script(f"ベンチマーク用のプロット {run}", stream=True):
+                if first is None:
+                    first = time.perf_counter() - start
+                characters += len(chunk)
+            first_chunks.append(first)
+            totals.append(time.perf_counter() - start)
+        if sum(model.calls for model in models) != STREAM_RUNS:
+            raise AssertionError('台本のストリーミング生成でスタブが想定どおりに呼ばれていません')
+    return {'throughput': round(characters / sum(totals)), 'unit': '文字/s', 'p50_ms': _percentiles(first_chunks)[0],
+            'p99_ms': _percentiles(totals)[1]}, None
+
+
+COMPONENTS = {
+    'basic_check': bench_basic_check,
+    'basic_check_incremental': bench_basic_check_incremental,
+    'parse_ai_response': bench_parse_ai_response,
+    'ai_check': bench_ai_check,
+    'autofix': bench_autofix,
+}
+# 行数によらない処理
+SINGLE_COMPONENTS = {
+    'script_stream': bench_script_stream,
+}
+
+
+def run_suite(options):
+    measured = {}
+    names = options.components or list(COMPONENTS) + list(SINGLE_COMPONENTS)
+    for size in options.sizes:
+        if not any(name in COMPONENTS for name in names):
+            break
+        text, expected = make_synthetic_script(size, seed=options.seed)
+        script = {'text': text, 'expected': expected, 'lines': size}
+        for name in names:
+            if name not in COMPONENTS:
+                continue
+            metrics, memory_run = COMPONENTS[name](script, options)
+            if memory_run is not None:
+                metrics['peak_mb'] = _peak_mb(memory_run)
+            measured[f"{name}/{size}"] = metrics
+            print(f"  計測しました: {name}/{size}", file=sys.stderr)
+    for name in names:
+        if name in SINGLE_COMPONENTS:
+            measured[name], _ = SINGLE_COMPONENTS[name](options)
+    return measured
+
+
+def settings_of(options):
+    # 基準値と比べるときに一致している必要がある設定 (スタブの待ち時間が違えば AI の計測値は比べられない)
+    return {'seed': options.seed, 'stub_latency_ms': options.stub_latency_ms, 'stub_jitter_ms': options.stub_jitter_ms,
+            'stub_issues': options.stub_issues}
+
+
+def regressions(metrics, base, tolerance):
+    # 基準値から悪化した項目の名前を返す
+    worse = []
+    if base.get('throughput') and metrics['throughput'] < base['throughput'] / tolerance:
+        worse.append('throughput')
+    for key, slack in SLACK.items():
+        if base.get(key) is not None and metrics.get(key) is not None and metrics[key] > base[key] * tolerance + slack:
+            worse.append(key)
+    return worse
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='校正ツールのベンチマーク')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='台本の行数')
+    parser.add_argument('--full', action='store_true', help=f'{FULL_SIZE:,} 行も計測する')
+    parser.add_argument('--components', nargs='+', choices=list(COMPONENTS) + list(SINGLE_COMPONENTS), help='計測する処理')
+    parser.add_argument('--update', action='store_true', help='計測値を新しい基準値として保存する')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基準値のファイル')
+    parser.add_argument('--json', help='計測値を JSON で書き出すファイル')
+    parser.add_argument('--seed', type=int, default=0, help='合成する台本の乱数シード')
+    parser.add_argument('--stub-latency-ms', type=float, default=20.0, help='スタブの応答までの待ち時間')
+    parser.add_argument('--stub-jitter-ms', type=float, default=10.0, help='スタブの待ち時間の揺らぎ (0〜指定値を足す)')
+    parser.add_argument('--stub-issues', type=int, default=5, help='スタブが1チャンクあたりに返す指摘数')
+    options = parser.parse_args(argv)
+    if options.full and FULL_SIZE not in options.sizes:
+        options.sizes = options.sizes + [FULL_SIZE]
+
+    try:
+        measured = run_suite(options)
+    except AssertionError as e:
+        print(f"計測結果が正しくありません: {e}")
+        return 1
+
+    if options.json:
+        with open(options.json, 'w', encoding='utf-8') as f:
+            json.dump({'settings': settings_of(options), 'results': measured}, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+
+    baseline = {'settings': settings_of(options), 'tolerance': DEFAULT_TOLERANCE, 'results': {}}
+    if os.path.exists(options.baseline):
+        with open(options.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    if options.update:
+        # 今回計測しなかった項目の基準値は残す
+        baseline['settings'] = settings_of(options)
+        baseline['results'].update(measured)
+        with open(options.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2)
+            f.write('\n')
+        print(f"基準値を更新しました: {options.baseline}")
+
+    compare = baseline.get('settings') == settings_of(options)
+    if not compare:
+        print('基準値と計測の設定 (シード・スタブの待ち時間など) が異なるため、回帰の判定は行いません')
+    tolerance = baseline.get('tolerance', DEFAULT_TOLERANCE)
+    failed = False
+    print(f"{'処理':<32} {'スループット':>16} {'基準':>12} {'p50 (ms)':>10} {'p99 (ms)':>10} {'ピーク (MB)':>11}")
+    for key, metrics in measured.items():
+        base = baseline['results'].get(key) if compare else None
+        worse = regressions(metrics, base, tolerance) if base else []
+        mark = f"  << 回帰 ({', '.join(worse)})" if worse else ''
+        failed = failed or bool(worse)
+        throughput = f"{metrics['throughput']:,} {metrics['unit']}"
+        base_throughput = f"{base['throughput']:,}" if base else '-'
+        peak = metrics.get('peak_mb')
+        print(f"{key:<32} {throughput:>16} {base_throughput:>12} {metrics['p50_ms']:>10.2f} {metrics['p99_ms']:>10.2f} "
+              f"{peak if peak is not None else '-':>11}{mark}")
+    if failed:
+        print(f"\n!!! 基準値 ({os.path.basename(options.baseline)}) から {tolerance} 倍を超えて悪化した処理があります !!!")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,59 @@
+# bench_user_dictionary.py (ユーザー辞書のベンチマーク)
+#
+# 実行方法: python benchmarks/bench_user_dictionary.py [行数]
+# 辞書の件数を変えながら、コンパイル時間・バイナリキャッシュからの読み込み時間・照合時間を計測する。
+# 照合時間が辞書の件数によらずほぼ一定であることを確認する。
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_basic_check import make_script
+from rule_engine import LineIndex
+from user_dictionary import load_dictionary
+
+KANA = 'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん'
+
+
+def write_dictionary(path, size, rng):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('出来ない\tできない\nという事\tということ\n')
+        for _ in range(size):
+            word = ''.join(rng.choice(KANA) for _ in range(rng.randint(3, 7)))
+            f.write(f"{word}\t{word}\n")
+
+
+def main(argv):
+    num_lines = int(argv[0]) if argv else 100000
+    text = make_script(num_lines, issue_ratio=0.2)
+    starts = LineIndex(text).starts
+    rng = random.Random(0)
+    print(f"テキスト: {num_lines} 行 / {len(text):,} 文字")
+    print(f"{'辞書件数':>8} {'コンパイル (s)':>14} {'キャッシュ読込 (s)':>18} {'照合 (s)':>10} {'指摘数':>8}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in [100, 1000, 10000, 30000]:
+            path = os.path.join(work_dir, f"style_{size}.tsv")
+            cache_dir = os.path.join(work_dir, 'cache')
+            write_dictionary(path, size, rng)
+
+            start = time.perf_counter()
+            load_dictionary(path, cache_dir)
+            compile_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            dictionary = load_dictionary(path, cache_dir)
+            load_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = dictionary.check(text, starts)
+            match_time = time.perf_counter() - start
+            print(f"{size:>8} {compile_time:>14.3f} {load_time:>18.3f} {match_time:>10.3f} {len(results):>8}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,134 @@
+# genai_stub.py (ベンチマーク用の Gemini スタブ)
+#
+# google.generativeai.GenerativeModel の代わりに、決まった待ち時間のあとで定型の応答を返すモデル。
+# - 校正プロンプト: 担当範囲の行から問題箇所を選び、指摘のマークダウン (--- 区切り) を返す
+# - 台本プロンプト: 合成した台本を返す (stream=True ならチャンクに分けて少しずつ返す)
+# - プロットプロンプト: 起承転結のそろったプロットを返す
+# 応答の内容と待ち時間の揺らぎはプロンプトから決まるため、何度実行しても同じになる。
+# install_stub() は proofreading_core が使う genai をこのスタブに差し替える (ライブラリがなくても動く)。
+
+import random
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import proofreading_core
+from synthetic_scripts import make_synthetic_script
+
+_OWN_RANGE = re.compile(r'指摘の対象は(\d+)行目から(\d+)行目まで')
+_NUMBERED_LINE = re.compile(r'^(\d+): (.*)$', re.MULTILINE)
+
+STUB_PLOT = """【スレタイ案】: 【衝撃】会社の休憩室で同期と話していたら、とんでもない事件に巻き込まれた結果www
+【登場人物】
+- イッチ: 入社3年目の会社員
+- 同期: イッチの同期
+【プロット】
+- 起: イッチが休憩室で同期と話していると、上司が急に呼び出してくる
+- 承: 呼び出された先で、身に覚えのないミスを押し付けられる
+- 転: 同期の証言で、本当の犯人が上司だったと分かる
+- 結: 上司は左遷され、イッチは昇進する
+"""
+
+
+class StubResponse:
+    def __init__(self, text, prompt):
+        self.text = text
+        self.parts = [text] if text else []
+        self.usage_metadata = SimpleNamespace(prompt_token_count=len(prompt), candidates_token_count=len(text),
+                                              total_token_count=len(prompt) + len(text))
+
+
+class StubStream:
+    # generate_content(stream=True) の戻り値。チャンクを返し終わると usage_metadata が読める
+    def __init__(self, text, prompt, first_delay, chunk_delay, chunk_chars):
+        self._chunks = [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+        self._first_delay = first_delay
+        self._chunk_delay = chunk_delay
+        self.usage_metadata = StubResponse(text, prompt).usage_metadata
+
+    def __iter__(self):
+        time.sleep(self._first_delay)
+        for index, chunk in enumerate(self._chunks):
+            if index:
+                time.sleep(self._chunk_delay)
+            yield StubResponse(chunk, '')
+
+
+class StubGenerativeModel:
+    def __init__(self, model_name, latency=0.02, jitter=0.01, issues_per_chunk=5, script_lines=120,
+                 stream_chunk_delay=0.002, stream_chunk_chars=40):
+        self.model_name = model_name
+        self.latency = latency
+        self.jitter = jitter
+        self.issues_per_chunk = issues_per_chunk
+        self.script_lines = script_lines
+        self.stream_chunk_delay = stream_chunk_delay
+        self.stream_chunk_chars = stream_chunk_chars
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt):
+        return random.Random(zlib.crc32(prompt.encode('utf-8')))
+
+    def _delay(self, rng):
+        return self.latency + rng.uniform(0, self.jitter)
+
+    def proofreading_response(self, prompt, rng):
+        own = _OWN_RANGE.search(prompt)
+        lines = {int(number): line for number, line in _NUMBERED_LINE.findall(prompt)}
+        candidates = [number for number in range(int(own.group(1)), int(own.group(2)) + 1)
+                      if len(lines.get(number, '')) >= 8] if own else []
+        blocks = []
+        for number in sorted(rng.sample(candidates, min(self.issues_per_chunk, len(candidates)))):
+            line = lines[number]
+            start = rng.randrange(line.find(':') + 2, len(line) - 3)
+            blocks.append(f"""- **種類**: {rng.choice(['誤字', '表記揺れ', '表現改善'])}
+- **行番号**: {number}
+- **問題箇所**: {line[start:start + 3]}
+- **修正案**: {line[start:start + 3][::-1]}
+- **理由**: ベンチマーク用の定型の指摘です
+""")
+        return '---\n' + '---\n'.join(blocks) + '---\n' if blocks else '指摘はありません。'
+
+    def respond(self, prompt, rng):
+        if 'プロの校正者' in prompt:
+            return self.proofreading_response(prompt, rng)
+        if 'プロの放送作家' in prompt:
+            return STUB_PLOT
+        return make_synthetic_script(self.script_lines, seed=rng.randrange(1 << 30))[0]
+
+    def generate_content(self, prompt, stream=False, **kwargs):
+        with self._lock:
+            self.calls += 1
+        rng = self._rng(prompt)
+        delay = self._delay(rng)
+        text = self.respond(prompt, rng)
+        if stream:
+            return StubStream(text, prompt, delay, self.stream_chunk_delay, self.stream_chunk_chars)
+        time.sleep(delay)
+        return StubResponse(text, prompt)
+
+
+@contextmanager
+def install_stub(**model_options):
+    # with install_stub(latency=0.05) as models: の間に作った AiAssistant はスタブを使う。
+    # models には作られたスタブのリストが入る (呼び出し回数の確認用)
+    models = []
+
+    def make_model(model_name):
+        model = StubGenerativeModel(model_name, **model_options)
+        models.append(model)
+        return model
+
+    stub = SimpleNamespace(configure=lambda **kwargs: None, GenerativeModel=make_model)
+    stub_client = SimpleNamespace(get_default_generative_client=lambda: None)
+    original = proofreading_core._import_genai, proofreading_core.GENAI_AVAILABLE
+    proofreading_core._import_genai = lambda: (stub, stub_client)
+    proofreading_core.GENAI_AVAILABLE = True
+    try:
+        yield models
+    finally:
+        proofreading_core._import_genai, proofreading_core.GENAI_AVAILABLE = original
@@ -0,0 +1,82 @@
+# synthetic_scripts.py (ベンチマーク用の 2ch風台本の生成)
+#
+# 指摘の種類ごとの出現率 (1行あたりの確率) を指定して、任意の行数の台本を生成する。
+# 指摘を含まない語句だけを組み合わせ、指摘の元になる断片を語句の間に挟むため、
+# 生成した台本に対する基本チェックの指摘数は、挟んだ断片の数と一致する (expected で返す)。
+# 顔文字・スラング・演出指示・複数行のセリフは指摘にならない要素として混ぜる。
+
+import random
+from collections import Counter
+
+# 指摘の元になる断片 (どれも基本チェックでちょうど1件の指摘になる)
+ISSUE_SNIPPETS = {
+    '句読点重複': '。。',
+    '感嘆符重複': '！？',
+    '空白重複': '  ',
+    '全角英数字': 'Ａ',
+    '表記統一': '出来る',
+    'ら抜き言葉': '見れる',
+}
+# 行の種類として入れる指摘 (開いたまま閉じないセリフ)
+UNCLOSED_QUOTE = 'セリフ閉じ忘れ'
+
+# 指摘にならない要素
+KAOMOJI = ['(´・ω・｀)', '(ﾟ∀ﾟ)', 'ｷﾀ━━━━(ﾟ∀ﾟ)━━━━!!']
+SLANG = ['ｗｗｗ', 'kwsk']
+DIRECTIVES = ['【画像: 会社の休憩室】', '【テロップ: 衝撃の事実】', '【画像: 駅のホーム】']
+
+# 句読点・記号・英数字・スラングの文字を含まない語句
+PHRASES = [
+    'これはイッチが実際に体験した話である', '今日は会社でちょっとした事件があった', '上司が急に呼び出してきた',
+    'まあなんとかなると思ってた', 'しかし事態は思わぬ方向へと進んでいく', 'それってどういうことなの',
+    '続きはよ', '詳しく聞かせて', '休憩室で同期と話していた', 'その後イッチは思いもよらない行動に出る',
+]
+SPEAKERS = ['N', 'イッチ', '名無しA', '名無しB', '名無しC']
+
+DEFAULT_DENSITIES = {
+    '句読点重複': 0.02,
+    '感嘆符重複': 0.02,
+    '空白重複': 0.01,
+    '全角英数字': 0.01,
+    '表記統一': 0.02,
+    'ら抜き言葉': 0.01,
+    UNCLOSED_QUOTE: 0.01,
+    'kaomoji': 0.05,
+    'slang': 0.05,
+    'directive': 0.03,
+    'multiline': 0.02,
+}
+
+
+def make_synthetic_script(num_lines, densities=None, seed=0):
+    # (テキスト, 基本チェックで見つかるはずの種類ごとの指摘数) を返す
+    densities = dict(DEFAULT_DENSITIES, **(densities or {}))
+    rng = random.Random(seed)
+    expected = Counter()
+    lines = []
+    while len(lines) < num_lines:
+        if rng.random() < densities['directive']:
+            lines.append(rng.choice(DIRECTIVES))
+            continue
+        # 語句と断片を交互に並べる (断片どうしが隣り合うと、1件の指摘にまとまってしまうため)
+        pieces = [rng.choice(PHRASES)]
+        for issue_type, snippet in ISSUE_SNIPPETS.items():
+            if rng.random() < densities[issue_type]:
+                pieces.extend([snippet, rng.choice(PHRASES)])
+                expected[issue_type] += 1
+        if rng.random() < densities['kaomoji']:
+            pieces.extend([rng.choice(KAOMOJI), rng.choice(PHRASES)])
+        if rng.random() < densities['slang']:
+            pieces.extend([rng.choice(SLANG), rng.choice(PHRASES)])
+        body = ''.join(pieces)
+        speaker = rng.choice(SPEAKERS)
+        if rng.random() < densities[UNCLOSED_QUOTE]:
+            lines.append(f"{speaker}: 「{body}")
+            expected[UNCLOSED_QUOTE] += 1
+        elif rng.random() < densities['multiline'] and len(lines) + 2 <= num_lines:
+            # 次の行まで続くセリフ (同じユニットの中で閉じるので指摘にならない)
+            lines.append(f"{speaker}: 「{body}")
+            lines.append(f"{rng.choice(PHRASES)}」")
+        else:
+            lines.append(f"{speaker}: {body}")
+    return '\n'.join(lines), expected
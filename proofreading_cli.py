@@ -0,0 +1,161 @@
+# proofreading_cli.py (台本の一括校正 CLI)
+#
+# 使い方:
+#   python proofreading_cli.py scripts/ --format jsonl --output results.jsonl
+#   cat 台本.txt | python proofreading_cli.py - --format csv
+#
+# ディレクトリ配下のファイルをプロセスプールで並列に基本チェックし、
+# 指摘を1件ずつ JSONL / CSV で書き出す。処理量 (files/s, MB/s) は標準エラーに出力する。
+
+import argparse
+import csv
+import fnmatch
+import json
+import os
+import sys
+import time
+from multiprocessing import Pool
+
+from proofreading_core import ScriptProofreadingTool
+from script_parser import is_unit_start
+from user_dictionary import DictionaryRegistry
+
+OUTPUT_FIELDS = ['file', 'line', 'position', 'severity', 'type', 'text', 'message']
+DEFAULT_DICTIONARY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'dictionaries')
+
+# ワーカープロセスごとに1つだけ作る校正ツール
+_worker_tool = None
+
+
+def _init_worker(dictionary_paths=(), dictionary_cache_dir=None):
+    # 辞書はメインプロセスでコンパイル済みのため、ここではバイナリキャッシュを読み込むだけになる
+    global _worker_tool
+    dictionaries = DictionaryRegistry(dictionary_paths, cache_dir=dictionary_cache_dir).refresh() if dictionary_paths else []
+    _worker_tool = ScriptProofreadingTool(dictionaries)
+
+
+def check_stream(tool, stream, block_lines):
+    # 大きなファイルも一度に読み込まず、block_lines 行ほどずつ区切ってチェックする。
+    # 括弧の対応はユニット (話者の行・空行・演出指示の行から始まるまとまり) の中で完結するため、
+    # ユニットの始まりで区切れば結果は変わらない。始まりが見つからないまま 2 倍に達したら、そこで区切る
+    results = []
+    block = []
+    first_line = 1
+    for line in stream:
+        line = line[:-1] if line.endswith('\n') else line
+        if len(block) >= block_lines and (is_unit_start(line) or len(block) >= block_lines * 2):
+            results.extend(tool.check_lines('\n'.join(block), first_line=first_line))
+            first_line += len(block)
+            block = []
+        block.append(line)
+    if block:
+        results.extend(tool.check_lines('\n'.join(block), first_line=first_line))
+    return results
+
+
+def check_file(args):
+    path, encoding, block_lines = args
+    try:
+        size = os.path.getsize(path)
+        # newline='\n' で開き、\r を含む行も text.split('\n') と同じ区切り方で読む
+        with open(path, encoding=encoding, errors='replace', newline='\n') as f:
+            return path, size, check_stream(_worker_tool, f, block_lines), None
+    except OSError as e:
+        return path, 0, [], str(e)
+
+
+def read_stdin(encoding, byte_count):
+    # 標準入力を行単位で読み、読んだバイト数を byte_count[0] に加算していく
+    for raw in sys.stdin.buffer:
+        byte_count[0] += len(raw)
+        yield raw.decode(encoding, errors='replace')
+
+
+def iter_paths(paths, pattern):
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    if fnmatch.fnmatch(name, pattern):
+                        yield os.path.join(root, name)
+        else:
+            yield path
+
+
+class ResultWriter:
+    def __init__(self, out, output_format):
+        self.out = out
+        self.output_format = output_format
+        if output_format == 'csv':
+            self.writer = csv.DictWriter(out, fieldnames=OUTPUT_FIELDS, extrasaction='ignore')
+            self.writer.writeheader()
+
+    def write(self, path, results):
+        for r in results:
+            row = {'file': path, **r}
+            if self.output_format == 'csv':
+                self.writer.writerow(row)
+            else:
+                self.out.write(json.dumps(row, ensure_ascii=False) + '\n')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='台本ファイルを一括で基本チェックし、指摘を JSONL / CSV で出力します。')
+    parser.add_argument('paths', nargs='*', default=['-'], help="チェックするファイルまたはディレクトリ ('-' は標準入力)")
+    parser.add_argument('--pattern', default='*.txt', help='ディレクトリ内で対象とするファイル名のパターン (既定: *.txt)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], default='jsonl', help='出力形式 (既定: jsonl)')
+    parser.add_argument('--output', '-o', help='出力先ファイル (省略時は標準出力)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='ワーカープロセス数 (既定: CPU数)')
+    parser.add_argument('--encoding', default='utf-8', help='入力ファイルの文字コード (既定: utf-8)')
+    parser.add_argument('--dict', action='append', default=[], metavar='PATH', help='ユーザー辞書のファイルまたはディレクトリ (複数指定可)')
+    parser.add_argument('--dict-cache', default=DEFAULT_DICTIONARY_CACHE_DIR, help='コンパイル済み辞書のキャッシュ先')
+    parser.add_argument('--block-lines', type=int, default=10000, help='一度にチェックする行数 (既定: 10000)')
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    out = open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+    writer = ResultWriter(out, args.format)
+    files = issues = total_bytes = failures = 0
+    started = time.perf_counter()
+    worker_args = (args.dict, args.dict_cache)
+    if args.dict:
+        registry = DictionaryRegistry(args.dict, cache_dir=args.dict_cache)
+        registry.refresh()
+        for problem in registry.problems():
+            print(f"辞書の警告: {problem}", file=sys.stderr)
+    try:
+        if args.paths == ['-']:
+            _init_worker(*worker_args)
+            byte_count = [0]
+            results = check_stream(_worker_tool, read_stdin(args.encoding, byte_count), args.block_lines)
+            writer.write('-', results)
+            files, issues, total_bytes = 1, len(results), byte_count[0]
+        else:
+            jobs = ((path, args.encoding, args.block_lines) for path in iter_paths(args.paths, args.pattern))
+            with Pool(args.workers, initializer=_init_worker, initargs=worker_args) as pool:
+                # 終わったファイルから順に書き出す
+                for path, size, results, error in pool.imap_unordered(check_file, jobs, chunksize=8):
+                    if error is not None:
+                        print(f"読み込みに失敗しました: {path}: {error}", file=sys.stderr)
+                        failures += 1
+                        continue
+                    writer.write(path, results)
+                    files += 1
+                    issues += len(results)
+                    total_bytes += size
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    megabytes = total_bytes / (1024 * 1024)
+    print(f"{files} ファイル / {megabytes:.1f} MB / 指摘 {issues} 件 / {elapsed:.2f} 秒 "
+          f"({files / elapsed:.1f} files/s, {megabytes / elapsed:.2f} MB/s)", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
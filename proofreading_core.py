@@ -0,0 +1,769 @@
+# proofreading_core.py (台本作成・校正ロジック)
+#
+# Streamlit に依存しない中核部分。proofreading_tool.py (Streamlit アプリ) と
+# proofreading_cli.py (バッチ用 CLI) の両方から読み込む。
+
+import hashlib
+import importlib.util
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from operator import itemgetter
+
+from ai_scheduler import PRIORITY_BULK, PRIORITY_INTERACTIVE, estimate_tokens
+from rule_engine import BASIC_PATTERNS, CompiledRuleSet, LineIndex, StreamingLineChecker
+from script_parser import PARSER_VERSION, bracket_results, check_length, is_unit_start, parse_brackets, parse_script
+from tracing import tracer
+
+# --- Google Generative AIライブラリのインポート ---
+# 読み込みに時間がかかるため、有無だけを確認し、実際の import は最初に使うときまで遅らせる
+try:
+    GENAI_AVAILABLE = importlib.util.find_spec('google.generativeai') is not None
+except ModuleNotFoundError:
+    GENAI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 基本チェックのルール定義 (と台本の解析方法) のバージョン。変わるとキャッシュ済みの校正ツールも作り直される
+RULESET_VERSION = hashlib.sha256(json.dumps([BASIC_PATTERNS, PARSER_VERSION], ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def _import_genai():
+    # (genai, 既定のクライアントを作る genai.client モジュール) を返す
+    import google.generativeai as genai
+    from google.generativeai import client
+    return genai, client
+
+
+# genai.configure はプロセス全体の設定を書き換えるため、設定してからクライアントを作るまでを1つずつ行う
+_GENAI_CLIENT_LOCK = threading.Lock()
+
+
+# --- 台本生成の共通ルール ---
+# 一括生成とパートごとの生成の両方のプロンプトで使う
+SCRIPT_STYLE_RULES = """- 会話は「イッチ:」「名無しA:」「名無しB:」のように、誰のセリフか明確にわかる形式で記述してください。
+- 2ch特有のネットスラング（例: www, 乙, 草, 激しく同意, kwsk）や顔文字（例: (´・ω・｀), ｷﾀ━━━━(ﾟ∀ﾟ)━━━━!!）を自然に、かつ効果的に使用してください。
+- 名無しさんたちのレスには、イッチへの質問、共感、ツッコミ、的確なアドバイス、面白い煽りなどをバランス良く含め、スレが進行しているライブ感を演出してください。
+- 物語の展開が分かりやすくなるように、適宜「N:」のナレーションで解説や補足を入れてください。
+- 動画の演出を考慮し、画像やテロップを挿入してほしい箇所に【画像: 〇〇の写真】【テロップ: 衝撃の事実！】のような具体的な指示を挿入してください。"""
+
+# 起承転結の各パートに割り当てる尺の割合
+SECTION_SHARES = {'起': 0.2, '承': 0.3, '転': 0.3, '結': 0.2}
+# この長さ (分) 以上の台本は、パートごとの並行生成を既定にする
+SECTION_GENERATION_MINUTES = 15
+
+# プロットの「- 起: ...」形式の行 (group 1 はパート名、group 2 は内容)
+_PLOT_SECTION = re.compile(r'^\s*[-・*]?\s*(?:\*\*)?[【\[]?([起承転結])[】\]]?(?:\*\*)?\s*[:：]\s*(.*)$')
+# 生成された台本の前後に付きがちな、本文ではない行 (コードブロック記号・見出し・パート名だけの行)
+_SECTION_ARTIFACT = re.compile(r'^\s*(?:```.*|#{1,6}\s.*|（ここに.*台本を生成）|[【\[]?[起承転結](?:パート)?[】\]]?\s*[:：]?)\s*$')
+
+
+def parse_plot_sections(plot):
+    # create_plot の出力から、共通の設定 (スレタイ・登場人物) と起承転結の各パートを取り出す
+    header = []
+    sections = []
+    for line in plot.split('\n'):
+        match = _PLOT_SECTION.match(line)
+        if match:
+            sections.append([match.group(1), match.group(2).strip()])
+        elif sections:
+            # パートの説明が複数行にわたる場合は続けてつなぐ
+            if line.strip():
+                sections[-1][1] = f"{sections[-1][1]} {line.strip()}".strip()
+        elif line.strip() and line.strip() != '【プロット】':
+            header.append(line.rstrip())
+    if [label for label, _ in sections] != ['起', '承', '転', '結']:
+        return None
+    return {'header': '\n'.join(header), 'sections': [tuple(section) for section in sections]}
+
+
+class SectionStitcher:
+    # パートごとに生成した台本を、行単位で1本の台本につなぐ。
+    # 各パートの前後の空行や見出しなどを取り除き、前のパートの末尾と同じ行で始まっている場合は重複を除く
+    BOUNDARY_LINES = 3
+    # 一致が1行だけのときは、この文字数以上の行に限って重複とみなす
+    # (「名無しA: 草」のような短い反応は、続けて書かれることがよくあるため)
+    SINGLE_LINE_MIN_CHARS = 12
+
+    def __init__(self):
+        self.tail = []
+        self._partial = ''
+        # 末尾の空行・見出しの可能性があるため、次の本文が来るまで出力を保留している行
+        self._held = []
+        # パートの冒頭で、重複を確かめるまで保留している行 (確かめ終わったら None)
+        self._head = None
+
+    def start_section(self):
+        self._head = []
+        self._held = []
+
+    def feed(self, text):
+        self._partial += text
+        if '\n' not in self._partial:
+            return ''
+        *lines, self._partial = self._partial.split('\n')
+        return self._format(self._accept(lines))
+
+    def end_section(self):
+        lines = [self._partial] if self._partial else []
+        self._partial = ''
+        out = self._accept(lines)
+        if self._head is not None:
+            out.extend(self._release_head())
+        # パート末尾の空行や見出しは捨てる
+        self._held = []
+        return self._format(out)
+
+    def _format(self, lines):
+        self.tail = (self.tail + [line.strip() for line in lines if line.strip()])[-self.BOUNDARY_LINES:]
+        return ''.join(line + '\n' for line in lines)
+
+    def _is_filler(self, line):
+        return not line.strip() or _SECTION_ARTIFACT.match(line) is not None
+
+    def _release_head(self):
+        # 前のパートの末尾 k 行と、このパートの先頭 k 行が同じなら、先頭の k 行を除く
+        head, self._head = self._head, None
+        content = [i for i, line in enumerate(head) if line.strip()]
+        for k in range(min(len(content), len(self.tail)), 0, -1):
+            if k == 1 and len(self.tail[-1]) < self.SINGLE_LINE_MIN_CHARS:
+                break
+            if [head[i].strip() for i in content[:k]] == self.tail[-k:]:
+                head = head[content[k - 1] + 1:]
+                break
+        return self._accept(head)
+
+    def _accept(self, lines):
+        out = []
+        for line in lines:
+            if self._head is not None:
+                if not self._head and self._is_filler(line):
+                    continue
+                self._head.append(line)
+                if sum(1 for l in self._head if l.strip()) >= self.BOUNDARY_LINES:
+                    out.extend(self._release_head())
+                continue
+            if self._is_filler(line):
+                self._held.append(line)
+                continue
+            out.extend(self._held)
+            self._held = []
+            out.append(line)
+        return out
+
+
+class ReportedStream:
+    # ストリームの途中で起きたエラーを on_error に通知し、そこで打ち切る。
+    # 打ち切られたかどうかは、読み終わったあとの error (起きた例外、なければ None) で分かる
+    def __init__(self, stream, on_error):
+        self._stream = stream
+        self._on_error = on_error
+        self.error = None
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        except Exception as e:
+            self.error = e
+            self._on_error(f"AIとの通信中にエラーが発生しました: {str(e)}")
+
+
+# --- AIロジッククラス ---
+class AiAssistant:
+    MODEL_NAME = 'gemini-1.5-flash-latest'
+
+    def __init__(self, api_key, cache=None, use_cache=True, on_error=None, scheduler=None):
+        if not GENAI_AVAILABLE or not api_key:
+            raise ValueError("Gemini APIキーが設定されていないか、ライブラリが利用できません。")
+        genai, genai_client = _import_genai()
+        # GenerativeModel は最初の呼び出しのときに、その時点で設定されているキーのクライアントを使う。
+        # キーごとに使い回す AiAssistant がほかのキーで送信しないよう、このキーのクライアントをここで作ってモデルに固定する。
+        # GenerativeModel._client は google-generativeai 0.8.x の内部属性に依存している (requirements.txt で <0.9 に固定)
+        with _GENAI_CLIENT_LOCK:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(self.MODEL_NAME)
+            self.model._client = genai_client.get_default_generative_client()
+        self.cache = cache
+        # use_cache=False でもキャッシュは参照しないだけで、新しい応答で上書きする
+        self.use_cache = use_cache
+        # エラーの通知先 (Streamlit からは st.error を渡す)
+        self.on_error = on_error or logger.error
+        # ai_scheduler.RequestScheduler (プロセス内で共有し、流量制限・再試行・相乗りを行う)
+        self.scheduler = scheduler
+
+    def _slot(self, priority, tokens):
+        return self.scheduler.slot(priority, tokens) if self.scheduler is not None else nullcontext()
+
+    def _record_usage(self, response, estimated_tokens):
+        # 応答のトークン数を (入力, 出力, 合計) の辞書で返し、スケジューラーの見積もりも補正する
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return {}
+        if self.scheduler is not None:
+            self.scheduler.record_usage(estimated_tokens, getattr(usage, 'prompt_token_count', None))
+        counts = {'prompt_tokens': getattr(usage, 'prompt_token_count', None),
+                  'output_tokens': getattr(usage, 'candidates_token_count', None),
+                  'total_tokens': getattr(usage, 'total_token_count', None)}
+        return {key: value for key, value in counts.items() if isinstance(value, int)}
+
+    def _call_model(self, prompt, tokens):
+        with tracer.span('gemini', model=self.MODEL_NAME, estimated_tokens=tokens) as attrs:
+            response = self.model.generate_content(prompt)
+            text = response.text
+            attrs.update(self._record_usage(response, tokens))
+        if self.cache is not None:
+            self.cache.set(self.MODEL_NAME, prompt, text)
+        return text
+
+    def _cached(self, prompt):
+        if self.cache is None or not self.use_cache:
+            return None
+        cached = self.cache.get(self.MODEL_NAME, prompt)
+        tracer.count('response_cache', 'miss' if cached is None else 'hit')
+        return cached
+
+    def _request(self, prompt, priority=PRIORITY_INTERACTIVE):
+        # 例外をそのまま送出する版 (ワーカースレッドから呼び出す場合に使う)
+        cached = self._cached(prompt)
+        if cached is not None:
+            return cached
+        tokens = estimate_tokens(prompt)
+        if self.scheduler is None:
+            return self._call_model(prompt, tokens)
+        # 同じプロンプトが実行中なら、その応答を待って共有する
+        return self.scheduler.submit((self.MODEL_NAME, prompt), lambda: self._call_model(prompt, tokens),
+                                     priority=priority, tokens=tokens)
+
+    def _generate(self, prompt, priority=PRIORITY_BULK):
+        try:
+            return self._request(prompt, priority=priority)
+        except Exception as e:
+            self.on_error(f"AIとの通信中にエラーが発生しました: {str(e)}")
+            return None
+
+    def _stream(self, prompt, priority=PRIORITY_BULK):
+        # 生成されたテキストを届いた順に返すジェネレーター。完了後の全文はキャッシュに保存する
+        # (例外をそのまま送出する版。ワーカースレッドから呼び出す場合に使う)
+        cached = self._cached(prompt)
+        if cached is not None:
+            yield cached
+            return
+        tokens = estimate_tokens(prompt)
+        parts = []
+        attempt = 0
+        while True:
+            try:
+                with self._slot(priority, tokens):
+                    # ジェネレーターはスパンで囲めない (呼び出し側の処理中も止まっている) ため、
+                    # 受信にかかった時間と最初のチャンクまでの時間を終わってから記録する
+                    started = time.perf_counter()
+                    first_chunk = None
+                    response = self.model.generate_content(prompt, stream=True)
+                    for chunk in response:
+                        if chunk.parts:
+                            if first_chunk is None:
+                                first_chunk = time.perf_counter() - started
+                            parts.append(chunk.text)
+                            yield chunk.text
+                    tracer.record('gemini', time.perf_counter() - started, model=self.MODEL_NAME, stream=True,
+                                  estimated_tokens=tokens, first_chunk_ms=round((first_chunk or 0.0) * 1000, 1),
+                                  **self._record_usage(response, tokens))
+                break
+            except Exception as e:
+                # 途中まで返したあとのエラーはやり直せない (同じ文章が二重に届くため)
+                delay = self.scheduler.retry_delay(e, attempt) if self.scheduler is not None and not parts else None
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+        if self.cache is not None and parts:
+            self.cache.set(self.MODEL_NAME, prompt, ''.join(parts))
+
+    def _report_errors(self, stream):
+        return ReportedStream(stream, self.on_error)
+
+    def _generate_stream(self, prompt, priority=PRIORITY_BULK):
+        return self._report_errors(self._stream(prompt, priority))
+
+    def _stream_sections(self, prompts, priority=PRIORITY_BULK):
+        # セクションごとのプロンプトを同時に生成し、台本の先頭から順に返す。
+        # 後ろのセクションは前のセクションを返している間も裏で生成が進むため、
+        # 全体の待ち時間はおおむね最も長いセクションの生成時間になる
+        buffers = [queue.Queue() for _ in prompts]
+        cancelled = threading.Event()
+
+        def produce(index):
+            try:
+                for text in self._stream(prompts[index], priority):
+                    if cancelled.is_set():
+                        return
+                    buffers[index].put(text)
+                buffers[index].put(None)
+            except Exception as e:
+                buffers[index].put(e)
+
+        executor = ThreadPoolExecutor(max_workers=len(prompts))
+        try:
+            for index in range(len(prompts)):
+                executor.submit(produce, index)
+            stitcher = SectionStitcher()
+            for buffer in buffers:
+                stitcher.start_section()
+                while True:
+                    item = buffer.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    text = stitcher.feed(item)
+                    if text:
+                        yield text
+                text = stitcher.end_section()
+                if text:
+                    yield text
+        finally:
+            # 途中で打ち切られた場合は、残りのセクションの受信もやめる
+            cancelled.set()
+            executor.shutdown(wait=False)
+
+    def build_plot_prompt(self, genre, theme):
+        return f"""
+あなたは、視聴者の心を掴む構成力に長けたプロの放送作家です。
+以下のテーマとジャンルに基づき、YouTubeの2ch風まとめ動画用の、面白くて魅力的なプロットを作成してください。
+
+# 指示
+- 物語の「起承転結」が明確にわかるように構成してください。
+- 主要な登場人物（イッチ、物語の中心となる人物など）を簡潔に設定してください。
+- 視聴者がワクワクするような、意外な展開やスカッとするクライマックスを必ず含めてください。
+- スレタイは視聴者のクリックを誘うような、魅力的で少し大げさなものにしてください。
+
+# 入力
+- ジャンル: {genre}
+- テーマ: {theme}
+
+# 出力形式
+【スレタイ案】: （例：【衝撃】駅で倒れた婆さんを助けたら、とんでもないお礼をされた結果www）
+【登場人物】
+- イッチ: （特徴や性格）
+- 〇〇: （他の登場人物の特徴）
+【プロット】
+- 起: （物語の始まり、イッチがスレを立てた状況）
+- 承: （物語の展開、問題の発生や葛藤）
+- 転: （事態の急変、クライマックスに向けた盛り上がり）
+- 結: （物語の結末、オチ、イッチの感想や後日談）
+"""
+
+    def create_plot(self, genre, theme):
+        with tracer.span('create_plot'):
+            return self._generate(self.build_plot_prompt(genre, theme))
+
+    def build_script_prompt(self, plot, length_minutes=8):
+        return f"""
+あなたは、2ch（5ch）の空気感を完璧に再現できるプロのシナリオライターです。
+以下のプロットとキャラクター設定に基づき、約{length_minutes}分の尺になるような、リアルで面白いYouTubeの2ch風動画台本を作成してください。
+
+# 厳守すべきルール
+- 必ず「N:」から始まるナレーションで台本を開始し、視聴者に状況を分かりやすく説明してください。
+{SCRIPT_STYLE_RULES}
+- 台本の最後は、ナレーションで物語を締めくくり、視聴者にチャンネル登録や高評価を促す言葉で綺麗に終わってください。（例：「この話が面白いと思ったら、高評価とチャンネル登録をお願いします！」）
+
+# 入力情報
+---
+{plot}
+---
+
+# 出力
+（ここに台本を生成）
+"""
+
+    def create_script(self, plot, length_minutes=8, stream=False):
+        prompt = self.build_script_prompt(plot, length_minutes)
+        if stream:
+            return self._generate_stream(prompt)
+        with tracer.span('create_script', length_minutes=length_minutes):
+            return self._generate(prompt)
+
+    def build_section_prompt(self, outline, index, length_minutes):
+        sections = outline['sections']
+        label, content = sections[index]
+        minutes = length_minutes * SECTION_SHARES.get(label, 1 / len(sections))
+        plot_outline = '\n'.join(f"- {l}: {c}" + ("  ← このパート" if i == index else '') for i, (l, c) in enumerate(sections))
+        if index == 0:
+            opening = "- 必ず「N:」から始まるナレーションで台本を開始し、視聴者に状況を分かりやすく説明してください。"
+        else:
+            opening = (f"- このパートは「{sections[index - 1][0]}」パート（{sections[index - 1][1]}）の直後から始まります。"
+                       "導入のあいさつや状況説明のやり直しはせず、前のパートの流れを受けてそのまま続けてください。")
+        if index == len(sections) - 1:
+            closing = "- 台本の最後は、ナレーションで物語を締めくくり、視聴者にチャンネル登録や高評価を促す言葉で綺麗に終わってください。"
+        else:
+            closing = (f"- 締めの言葉やチャンネル登録の呼びかけは入れず、次の「{sections[index + 1][0]}」パート"
+                       f"（{sections[index + 1][1]}）へ自然につながる形で終えてください。")
+        return f"""
+あなたは、2ch（5ch）の空気感を完璧に再現できるプロのシナリオライターです。
+YouTubeの2ch風動画台本（全体で約{length_minutes}分）を、起承転結のパートに分けて複数人で分担して執筆しています。
+あなたの担当は「{label}」パートです。約{minutes:.0f}分の尺になるように、このパートの台本だけを作成してください。
+
+# 厳守すべきルール
+{opening}
+{SCRIPT_STYLE_RULES}
+{closing}
+- 見出しやパート名、前置きは書かず、台本の本文だけを出力してください。
+
+# 共通の設定
+{outline['header']}
+
+# プロット全体
+{plot_outline}
+
+# 出力
+（ここに「{label}」パートの台本を生成）
+"""
+
+    def build_section_prompts(self, plot, length_minutes):
+        # プロットから起承転結を読み取れなければ None を返す
+        outline = parse_plot_sections(plot)
+        if outline is None:
+            return None
+        return [self.build_section_prompt(outline, index, length_minutes) for index in range(len(outline['sections']))]
+
+    def create_script_sections(self, plot, length_minutes=20, stream=False):
+        # 起承転結のパートごとに並行して生成し、1本の台本につなぐ (長尺向け)
+        prompts = self.build_section_prompts(plot, length_minutes)
+        if prompts is None:
+            return self.create_script(plot, length_minutes, stream=stream)
+        if stream:
+            return self._report_errors(self._stream_sections(prompts))
+        try:
+            with tracer.span('create_script_sections', length_minutes=length_minutes, sections=len(prompts)):
+                return ''.join(self._stream_sections(prompts))
+        except Exception as e:
+            self.on_error(f"AIとの通信中にエラーが発生しました: {str(e)}")
+            return None
+
+
+# --- 校正ツールクラス ---
+def split_into_chunks(lines, chunk_lines, overlap):
+    # 各チャンクは担当範囲 (own_start〜own_end) の前後に overlap 行の文脈を付けた行ウィンドウ。
+    # 担当範囲の区切りは行の内容から決めるため、行を追加・削除しても
+    # 離れた場所のチャンクは区切りも内容も変わらない (再チェック時に結果を再利用できる)
+    min_lines = max(1, chunk_lines // 2)
+    max_lines = max(min_lines, chunk_lines * 3 // 2)
+    divisor = max(1, chunk_lines - min_lines)
+    chunks = []
+    own_start = 0
+    previous = b''
+    # 直前の区切りが max_lines での強制的なものか。強制的な区切りの位置は行の追加・削除でずれるため、
+    # 次の区切りは min_lines に満たなくても内容から決まる候補で区切り、そこから先を元の区切りにそろえ直す
+    forced = False
+    for i, line in enumerate(lines):
+        encoded = line.encode('utf-8')
+        size = i - own_start + 1
+        # 同じ行が何度も現れる台本でも候補が見つかるよう、直前の行と合わせた内容で決める
+        is_boundary = (forced or size >= min_lines) and zlib.crc32(encoded, zlib.crc32(previous + b'\n')) % divisor == 0
+        previous = encoded
+        if is_boundary or size >= max_lines or i == len(lines) - 1:
+            forced = not is_boundary
+            own_end = i + 1
+            start = max(0, own_start - overlap)
+            end = min(len(lines), own_end + overlap)
+            chunks.append({'start': start, 'own_start': own_start, 'own_end': own_end, 'lines': lines[start:end]})
+            own_start = own_end
+    return chunks
+
+
+def _common_run(old_lines, i, new_lines, j):
+    # old_lines[i:] と new_lines[j:] の先頭から一致する行数を返す。
+    # 比較する幅を倍々に広げ、スライス同士の比較 (C 実装) で一気に確かめる
+    limit = min(len(old_lines) - i, len(new_lines) - j)
+    run, step = 0, 64
+    while run < limit:
+        width = min(step, limit - run)
+        if old_lines[i + run:i + run + width] == new_lines[j + run:j + run + width]:
+            run += width
+            step *= 2
+        elif width > 1:
+            step = width // 2
+        else:
+            break
+    return run
+
+
+def diff_line_blocks(old_lines, new_lines):
+    # difflib の opcodes 形式 (tag, i1, i2, j1, j2) で行単位の差分を返す。
+    # 一致が途切れたら、新旧どちらにも1回しか現れない行を目印に同期し直す (patience diff の簡易版)。
+    # SequenceMatcher と違い、行数に対してほぼ線形の時間で済む
+    new_counts = old_positions = None
+    opcodes = []
+    i = j = 0
+    while True:
+        run = _common_run(old_lines, i, new_lines, j)
+        if run:
+            opcodes.append(('equal', i, i + run, j, j + run))
+            i += run
+            j += run
+        if i == len(old_lines) and j == len(new_lines):
+            break
+
+        # 次に同期できる行 (目印) を new_lines から探す。索引は最初に一致が途切れたときに作る
+        if old_positions is None:
+            old_counts = Counter(old_lines[i:])
+            new_counts = Counter(new_lines[j:])
+            old_positions = {line: pos for pos, line in enumerate(old_lines[i:], i) if old_counts[line] == 1}
+        next_i, next_j = len(old_lines), len(new_lines)
+        for k in range(j, len(new_lines)):
+            line = new_lines[k]
+            pos = old_positions.get(line)
+            if pos is not None and pos >= i and new_counts[line] == 1:
+                next_i, next_j = pos, k
+                break
+
+        # 目印までの区間のうち、末尾の一致部分は変更箇所から除く
+        suffix = 0
+        while suffix < next_i - i and suffix < next_j - j and old_lines[next_i - suffix - 1] == new_lines[next_j - suffix - 1]:
+            suffix += 1
+        changed_old, changed_new = next_i - suffix - i, next_j - suffix - j
+        if changed_old or changed_new:
+            tag = 'replace' if changed_old and changed_new else ('delete' if changed_old else 'insert')
+            opcodes.append((tag, i, next_i - suffix, j, next_j - suffix))
+        if suffix:
+            opcodes.append(('equal', next_i - suffix, next_i, next_j - suffix, next_j))
+        i, j = next_i, next_j
+    return opcodes
+
+
+class ScriptProofreadingTool:
+    # AIチェックの分割設定 (1チャンクの平均担当行数・前後の文脈行数・同時リクエスト数)
+    AI_CHUNK_LINES = 150
+    AI_CHUNK_OVERLAP = 10
+    AI_MAX_WORKERS = 4
+
+    def __init__(self, dictionaries=None):
+        self.basic_patterns = BASIC_PATTERNS
+        # パターンは一度だけコンパイルし、テキスト全体を1パスで走査する
+        self.rule_set = CompiledRuleSet(self.basic_patterns)
+        # ユーザー辞書 (user_dictionary.UserDictionary のリスト)
+        self.dictionaries = list(dictionaries or [])
+        # ルールや辞書が変わったら、前回の結果を再利用せずにチェックし直す
+        self.version = (RULESET_VERSION,) + tuple(dictionary.version for dictionary in self.dictionaries)
+
+    def check_lines(self, text, first_line=1):
+        # 基本チェック。text は first_line 行目から始まる部分テキストでもよいが、
+        # 括弧の対応はユニット (script_parser を参照) の中で判定するため、ユニットの途中で区切らないこと
+        with tracer.span('check_lines', lines=text.count('\n') + 1):
+            # 話者ターンは使わないため、括弧の対応だけを求める
+            with tracer.span('parse_brackets'):
+                document = parse_brackets(text, LineIndex(text).starts)
+            # 顔文字やスラングの中 (ｗｗｗ、(ﾟ∀ﾟ)━━!! など) は表記ルールの対象外。
+            # 範囲はルールに一致があったときに初めて求める
+            results = self.rule_set.check(text, first_line=first_line, line_starts=document.line_starts, skip=document.in_span)
+            results.extend(bracket_results(document, first_line))
+            for dictionary in self.dictionaries:
+                with tracer.span(f"dictionary:{dictionary.name}"):
+                    results.extend(dictionary.check(text, document.line_starts, first_line=first_line))
+            # 同じ行の中では、組み込みルール → 括弧の対応 → 辞書の順に並べる (安定ソート)
+            results.sort(key=itemgetter('line'))
+            return results
+
+    def estimate_length(self, text, length_minutes=None):
+        # 読み上げ時間の目安と、目標の尺 (分) から外れている場合の指摘 (なければ None) を返す
+        return check_length(parse_script(text), length_minutes)
+
+    def streaming_checker(self):
+        return StreamingLineChecker(self.check_lines, version=self.version, is_unit_start=is_unit_start)
+
+    def perform_basic_check(self, text, state=None):
+        with tracer.span('perform_basic_check') as attrs:
+            results = self._perform_basic_check(text, state)
+            attrs['issues'] = len(results)
+            if state is not None:
+                attrs['rechecked_lines'] = state['rechecked_lines']
+            return results
+
+    def _perform_basic_check(self, text, state):
+        if state is None:
+            return self.check_lines(text)
+
+        # state には前回の行と行ごとの結果を保持し、変更のあった行だけを再チェックする
+        lines = text.split('\n')
+        old_lines = state.get('lines')
+        if old_lines is None or state.get('version') != self.version:
+            opcodes = [('insert', 0, 0, 0, len(lines))]
+        else:
+            opcodes = diff_line_blocks(old_lines, lines)
+
+        old_results = state.get('results')
+        line_results = [None] * len(lines)
+        changed = []
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == 'equal':
+                shift = j1 - i1
+                if shift:
+                    # 行番号がずれた行だけ結果を複製して付け替える
+                    line_results[j1:j2] = [[dict(r, line=r['line'] + shift) for r in results] if results else results
+                                           for results in old_results[i1:i2]]
+                else:
+                    line_results[j1:j2] = old_results[i1:i2]
+            else:
+                changed.append((j1, j2))
+
+        # 括弧の対応はユニット単位で決まるため、変更箇所の直前の行から次のユニットの始まりまでを再チェックする
+        ranges = []
+        for j1, j2 in changed:
+            start = max(0, j1 - 1)
+            while start > 0 and not is_unit_start(lines[start]):
+                start -= 1
+            end = j2
+            while end < len(lines) and not is_unit_start(lines[end]):
+                end += 1
+            if ranges and start <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
+
+        rechecked = 0
+        for start, end in ranges:
+            if end <= start:
+                continue
+            for j in range(start, end):
+                line_results[j] = []
+            for r in self.check_lines('\n'.join(lines[start:end]), first_line=start + 1):
+                line_results[r['line'] - 1].append(r)
+            rechecked += end - start
+
+        state['version'] = self.version
+        state['lines'] = lines
+        state['results'] = line_results
+        state['rechecked_lines'] = rechecked
+        return [r for results in line_results for r in results]
+    
+    def perform_ai_check(self, text, api_key=None, cache=None, use_cache=True, state=None, on_error=None, assistant=None,
+                         priority=PRIORITY_INTERACTIVE):
+        # assistant を渡した場合はそれを使い、api_key / cache / use_cache は無視する
+        # priority は一括処理から呼ぶ場合に PRIORITY_BULK を渡す
+        with tracer.span('perform_ai_check') as attrs:
+            results = self._perform_ai_check(text, api_key, cache, use_cache, state, on_error, assistant, priority, attrs)
+            attrs['issues'] = len(results)
+            return results
+
+    def _perform_ai_check(self, text, api_key, cache, use_cache, state, on_error, assistant, priority, attrs):
+        on_error = on_error or logger.error
+        if assistant is None:
+            try:
+                assistant = AiAssistant(api_key, cache=cache, use_cache=use_cache, on_error=on_error)
+            except ValueError as e:
+                on_error(str(e))
+                return []
+        use_cache = assistant.use_cache
+
+        # 長い台本は重なりのある行ウィンドウに分割し、並列にAIへ送る
+        chunks = split_into_chunks(text.split('\n'), self.AI_CHUNK_LINES, self.AI_CHUNK_OVERLAP)
+        for chunk in chunks:
+            chunk['prompt'] = self.build_ai_prompt(chunk)
+            chunk['fingerprint'] = hashlib.blake2b(chunk['prompt'].encode('utf-8'), digest_size=16).hexdigest()
+
+        # 前回と同じ内容のチャンクは、保持しておいた結果をそのまま使う
+        # (キャッシュを使わない指定のときは、すべてのチャンクを問い合わせ直す)
+        previous = state.get('chunks', {}) if state is not None and use_cache else {}
+        pending = [chunk for chunk in chunks if chunk['fingerprint'] not in previous]
+        tracer.count('ai_chunks', 'hit', len(chunks) - len(pending))
+        tracer.count('ai_chunks', 'miss', len(pending))
+        attrs.update(chunks=len(chunks), requested_chunks=len(pending))
+
+        def check_chunk(chunk):
+            try:
+                return assistant._request(chunk['prompt'], priority=priority), None
+            except Exception as e:
+                return None, e
+
+        responses = {}
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(self.AI_MAX_WORKERS, len(pending))) as executor:
+                for chunk, (response, error) in zip(pending, executor.map(check_chunk, pending)):
+                    if error is not None:
+                        on_error(f"AIとの通信中にエラーが発生しました (行 {chunk['own_start'] + 1}〜{chunk['own_end']}): {str(error)}")
+                        continue
+                    responses[chunk['fingerprint']] = self.parse_chunk_response(chunk, response) if response else []
+
+        results = []
+        seen = set()
+        chunk_results = {}
+        for chunk in chunks:
+            fingerprint = chunk['fingerprint']
+            local_issues = previous[fingerprint] if fingerprint in previous else responses.get(fingerprint)
+            if local_issues is None:
+                continue
+            chunk_results[fingerprint] = local_issues
+            for local_issue in local_issues:
+                # チャンク内の行番号を全体の行番号に変換する
+                issue = dict(local_issue, line=local_issue['line'] + chunk['start']) if local_issue.get('line') else dict(local_issue)
+                key = (issue.get('line', 0), issue['type'], issue.get('text', ''))
+                if key in seen:
+                    continue
+                seen.add(key)
+                results.append(issue)
+
+        if state is not None:
+            state['chunks'] = chunk_results
+            state['requested_chunks'] = len(pending)
+        return results
+
+    def parse_chunk_response(self, chunk, response_text):
+        # 行番号はチャンク内の番号のまま返し、担当範囲外 (重なり部分) の指摘は捨てる
+        own_first = chunk['own_start'] - chunk['start'] + 1
+        own_last = chunk['own_end'] - chunk['start']
+        with tracer.span('parse_ai_response'):
+            return [issue for issue in self.parse_ai_response(response_text)
+                    if not issue.get('line') or own_first <= issue['line'] <= own_last]
+
+    def build_ai_prompt(self, chunk):
+        numbered_text = '\n'.join(f"{i}: {line}" for i, line in enumerate(chunk['lines'], 1))
+        own_first = chunk['own_start'] - chunk['start'] + 1
+        own_last = chunk['own_end'] - chunk['start']
+        return f"""あなたはプロの校正者です。以下のテキストをレビューし、誤字脱字、文法的な誤り、表記の揺れ、不自然な言い回しを指摘してください。
+テキストの各行の先頭には「行番号: 」が付いています。指摘の対象は{own_first}行目から{own_last}行目までとし、それ以外の行は前後の文脈として参照するだけにしてください。
+出力は問題点ごとに、必ず以下の形式のマークダウンで返してください。
+---
+- **種類**: (例: 誤字, 表記揺れ, 表現改善)
+- **行番号**: (問題がある箇所の行番号)
+- **問題箇所**: (原文のテキスト)
+- **修正案**: (具体的な修正案)
+- **理由**: (なぜ修正が必要なのか、その理由)
+---
+
+# 校正対象テキスト
+{numbered_text}
+"""
+
+    def parse_ai_response(self, response_text):
+        results = []
+        issues = response_text.strip().split('---')
+        for issue_block in issues:
+            if not issue_block.strip(): continue
+            current_issue = {}
+            for line in issue_block.strip().split('\n'):
+                line = line.replace('**', '') # マークダウンの**を除去
+                if ':' in line:
+                    key, value = line.split(':', 1)
+                    key = key.strip().replace('-', '').strip()
+                    value = value.strip()
+                    if key == "種類": current_issue['type'] = f"AI: {value}"
+                    elif key == "行番号": current_issue['line'] = int(re.search(r'\d+', value).group()) if re.search(r'\d+', value) else 0
+                    elif key == "問題箇所": current_issue['text'] = value
+                    elif key == "修正案":
+                        current_issue['message'] = f"提案: {value}"
+                        current_issue['replacement'] = value
+                    elif key == "理由": current_issue['message'] = f"{current_issue.get('message', '')} ({value})"
+            if 'type' in current_issue:
+                current_issue.setdefault('message', 'AIによる指摘')
+                error_types = ['誤字', '文法エラー', '脱字']
+                is_error = any(err_type in current_issue['type'] for err_type in error_types)
+                current_issue['severity'] = 'error' if is_error else 'suggestion'
+                results.append(current_issue)
+        return results
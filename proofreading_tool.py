@@ -1,18 +1,20 @@
 # proofreading_tool_v2.py (台本作成機能 統合・完成版)
 
 import streamlit as st
-import re
-import pandas as pd
+import time
 from datetime import datetime
-import io
+import os
 import html # HTMLエスケープ用
+import io
+import zipfile
 
-# --- Google Generative AIライブラリのインポート ---
-try:
-    import google.generativeai as genai
-    GENAI_AVAILABLE = True
-except ImportError:
-    GENAI_AVAILABLE = False
+from ai_scheduler import RequestScheduler
+from autofix import apply_fixes
+from batch_pipeline import CHECKPOINT_NAME, BatchPipeline, format_progress, parse_jobs, read_checkpoint
+from proofreading_core import RULESET_VERSION, SECTION_GENERATION_MINUTES, AiAssistant, ScriptProofreadingTool
+from response_cache import ResponseCache
+from tracing import tracer
+from user_dictionary import DictionaryRegistry
 
 # --- ページ設定 ---
 st.set_page_config(
@@ -22,10 +24,83 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- AI応答キャッシュの設定 ---
+# 同じモデル・同じプロンプトへの応答は再利用し、Gemini への往復を省く
+RESPONSE_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'ai_responses.sqlite3')
+RESPONSE_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+RESPONSE_CACHE_MAX_ENTRIES = 5000
+
+
+@st.cache_resource
+def get_response_cache():
+    # Streamlit の再実行をまたいでプロセス全体で共有する
+    return ResponseCache(RESPONSE_CACHE_PATH, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, max_entries=RESPONSE_CACHE_MAX_ENTRIES)
+
+
+# --- AIリクエストの流量制限 ---
+# チーム全員で1つのプロセスを使うため、Gemini への呼び出しは APIキーごとに1つのスケジューラーを通す
+# (上限は Gemini のプランに合わせて調整する)
+AI_REQUESTS_PER_MINUTE = 15
+AI_TOKENS_PER_MINUTE = 1_000_000
+AI_MAX_CONCURRENT_REQUESTS = 4
+AI_MAX_RETRIES = 5
+# APIキーごとのスケジューラー・クライアントを残しておく件数と時間 (秒)。
+# 入力されたキーをプロセスにいつまでも残さないよう、古いものから捨てる
+AI_CLIENT_CACHE_ENTRIES = 8
+AI_CLIENT_CACHE_TTL_SECONDS = 60 * 60
+
+
+# --- 一括生成の設定 ---
+# アップロードしたジョブファイルごとに output/<ファイル名>/ へ成果物を書き出す
+BATCH_OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'output')
+
+
+# --- ユーザー辞書の設定 ---
+# dictionaries/ に置いた TSV / JSON の表記辞書・NGワード辞書を基本チェックに加える
+USER_DICTIONARY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'dictionaries')
+DICTIONARY_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'dictionaries')
+
+
+# --- 共有リソース ---
+# Streamlit は操作のたびにスクリプト全体を再実行するため、
+# 作成コストのかかるオブジェクトはプロセス全体で使い回す
+@st.cache_resource(max_entries=AI_CLIENT_CACHE_ENTRIES, ttl=AI_CLIENT_CACHE_TTL_SECONDS)
+def get_scheduler(api_key):
+    # クォータは APIキー単位でかかるため、同じキーの利用者全員で共有する
+    return RequestScheduler(requests_per_minute=AI_REQUESTS_PER_MINUTE, tokens_per_minute=AI_TOKENS_PER_MINUTE,
+                            max_concurrency=AI_MAX_CONCURRENT_REQUESTS, max_retries=AI_MAX_RETRIES)
+
+
+# キャッシュの利用あり・なしの2通りがあるため、スケジューラーの2倍まで残す
+@st.cache_resource(max_entries=AI_CLIENT_CACHE_ENTRIES * 2, ttl=AI_CLIENT_CACHE_TTL_SECONDS)
+def get_assistant(api_key, use_cache):
+    return AiAssistant(api_key, cache=get_response_cache(), use_cache=use_cache, on_error=st.error,
+                       scheduler=get_scheduler(api_key))
+
+
+@st.cache_resource
+def get_dictionary_registry():
+    return DictionaryRegistry(USER_DICTIONARY_DIR, cache_dir=DICTIONARY_CACHE_DIR)
+
+
+@st.cache_resource(max_entries=4)
+def get_proofreading_tool(ruleset_version, dictionary_version):
+    # ルール定義や辞書が変わったとき (バージョンが変わったとき) だけ作り直す
+    return ScriptProofreadingTool(get_dictionary_registry().dictionaries)
+
+
+def current_proofreading_tool():
+    # 辞書ファイルが更新されていれば読み直し、新しい辞書で作った校正ツールに差し替える
+    registry = get_dictionary_registry()
+    registry.refresh()
+    return get_proofreading_tool(RULESET_VERSION, registry.version())
+
+
 # --- Session State の初期化 ---
 # アプリのリロード時に変数がリセットされるのを防ぐ
 if 'results' not in st.session_state:
-    st.session_state['results'] = []
+    # 校正結果は列指向の DataFrame で保持する (results_to_frame を参照)
+    st.session_state['results'] = None
 if 'script_text' not in st.session_state:
     st.session_state['script_text'] = ""
 if 'run_check' not in st.session_state:
@@ -34,6 +109,15 @@ if 'generated_plot' not in st.session_state:
     st.session_state['generated_plot'] = ""
 if 'generated_script' not in st.session_state:
     st.session_state['generated_script'] = ""
+if 'generated_check' not in st.session_state:
+    # 台本のストリーミング生成中に済ませた基本チェックの結果
+    st.session_state['generated_check'] = None
+if 'autofix' not in st.session_state:
+    # 自動修正の結果 (autofix.apply_fixes の戻り値)
+    st.session_state['autofix'] = None
+if 'check_state' not in st.session_state:
+    # 前回の校正内容 (行・チャンクごとの結果)。再校正時は変更箇所だけをチェックする
+    st.session_state['check_state'] = {'basic': {}, 'ai': {}}
 
 # --- カスタムCSS ---
 st.markdown("""
@@ -68,142 +152,209 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-# --- AIロジッククラス ---
-class AiAssistant:
-    def __init__(self, api_key):
-        if not GENAI_AVAILABLE or not api_key:
-            raise ValueError("Gemini APIキーが設定されていないか、ライブラリが利用できません。")
-        genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel('gemini-1.5-flash-latest')
-
-    def _generate(self, prompt):
-        try:
-            response = self.model.generate_content(prompt)
-            return response.text
-        except Exception as e:
-            st.error(f"AIとの通信中にエラーが発生しました: {str(e)}")
-            return None
-
-    def create_plot(self, genre, theme):
-        prompt = f"""
-あなたは、視聴者の心を掴む構成力に長けたプロの放送作家です。
-以下のテーマとジャンルに基づき、YouTubeの2ch風まとめ動画用の、面白くて魅力的なプロットを作成してください。
-
-# 指示
-- 物語の「起承転結」が明確にわかるように構成してください。
-- 主要な登場人物（イッチ、物語の中心となる人物など）を簡潔に設定してください。
-- 視聴者がワクワクするような、意外な展開やスカッとするクライマックスを必ず含めてください。
-- スレタイは視聴者のクリックを誘うような、魅力的で少し大げさなものにしてください。
-
-# 入力
-- ジャンル: {genre}
-- テーマ: {theme}
-
-# 出力形式
-【スレタイ案】: （例：【衝撃】駅で倒れた婆さんを助けたら、とんでもないお礼をされた結果www）
-【登場人物】
-- イッチ: （特徴や性格）
-- 〇〇: （他の登場人物の特徴）
-【プロット】
-- 起: （物語の始まり、イッチがスレを立てた状況）
-- 承: （物語の展開、問題の発生や葛藤）
-- 転: （事態の急変、クライマックスに向けた盛り上がり）
-- 結: （物語の結末、オチ、イッチの感想や後日談）
-"""
-        return self._generate(prompt)
-
-    def create_script(self, plot, length_minutes=8):
-        prompt = f"""
-あなたは、2ch（5ch）の空気感を完璧に再現できるプロのシナリオライターです。
-以下のプロットとキャラクター設定に基づき、約{length_minutes}分の尺になるような、リアルで面白いYouTubeの2ch風動画台本を作成してください。
-
-# 厳守すべきルール
-- 必ず「N:」から始まるナレーションで台本を開始し、視聴者に状況を分かりやすく説明してください。
-- 会話は「イッチ:」「名無しA:」「名無しB:」のように、誰のセリフか明確にわかる形式で記述してください。
-- 2ch特有のネットスラング（例: www, 乙, 草, 激しく同意, kwsk）や顔文字（例: (´・ω・｀), ｷﾀ━━━━(ﾟ∀ﾟ)━━━━!!）を自然に、かつ効果的に使用してください。
-- 名無しさんたちのレスには、イッチへの質問、共感、ツッコミ、的確なアドバイス、面白い煽りなどをバランス良く含め、スレが進行しているライブ感を演出してください。
-- 物語の展開が分かりやすくなるように、適宜「N:」のナレーションで解説や補足を入れてください。
-- 動画の演出を考慮し、画像やテロップを挿入してほしい箇所に【画像: 〇〇の写真】【テロップ: 衝撃の事実！】のような具体的な指示を挿入してください。
-- 台本の最後は、ナレーションで物語を締めくくり、視聴者にチャンネル登録や高評価を促す言葉で綺麗に終わってください。（例：「この話が面白いと思ったら、高評価とチャンネル登録をお願いします！」）
-
-# 入力情報
----
-{plot}
----
-
-# 出力
-（ここに台本を生成）
-"""
-        return self._generate(prompt)
-
-
-# --- 校正ツールクラス ---
-class ScriptProofreadingTool:
-    def __init__(self):
-        self.basic_patterns = [
-            {'pattern': r'[。、]{2,}', 'type': '句読点重複', 'message': '句読点が重複しています'},
-            {'pattern': r'[!?！？]{2,}', 'type': '感嘆符重複', 'message': '感嘆符や疑問符が重複しています'},
-            {'pattern': r'\s{2,}', 'type': '空白重複', 'message': '不要な空白が連続しています'},
-            {'pattern': r'[ａ-ｚＡ-Ｚ０-９]', 'type': '全角英数字', 'message': '全角英数字が使用されています。半角に統一することを推奨します'},
-            {'pattern': r'という事', 'type': '表記統一', 'message': '「という事」はひらがなで「ということ」と書くのが一般的です'},
-            {'pattern': r'出来る', 'type': '表記統一', 'message': '補助動詞の「できる」はひらがなで書くのが一般的です'},
-            {'pattern': r'見れる', 'type': 'ら抜き言葉', 'message': '「見れる」は「見られる」が正しい表現です'},
-        ]
-
-    def perform_basic_check(self, text):
-        results = []
-        lines = text.split('\n')
-        for line_idx, line in enumerate(lines, 1):
-            for pattern_info in self.basic_patterns:
-                for match in re.finditer(pattern_info['pattern'], line):
-                    results.append({'type': pattern_info['type'], 'line': line_idx, 'position': match.start(), 'text': match.group(), 'message': pattern_info['message'], 'severity': 'suggestion'})
-            if '「' in line and '」' not in line:
-                results.append({'type': 'セリフ閉じ忘れ', 'line': line_idx, 'position': line.find('「'), 'text': '「', 'message': 'セリフの閉じ括弧「」」が見つかりません', 'severity': 'error'})
-        return results
-    
-    def perform_ai_check(self, text, api_key):
-        try:
-            assistant = AiAssistant(api_key)
-            prompt = f"""あなたはプロの校正者です。以下のテキストをレビューし、誤字脱字、文法的な誤り、表記の揺れ、不自然な言い回しを指摘してください。
-出力は問題点ごとに、必ず以下の形式のマークダウンで返してください。
----
-- **種類**: (例: 誤字, 表記揺れ, 表現改善)
-- **行番号**: (問題がある箇所の行番号)
-- **問題箇所**: (原文のテキスト)
-- **修正案**: (具体的な修正案)
-- **理由**: (なぜ修正が必要なのか、その理由)
----
-"""
-            response = assistant._generate(prompt)
-            return self.parse_ai_response(response) if response else []
-        except ValueError as e:
-            st.error(e)
-            return []
-
-    def parse_ai_response(self, response_text):
-        results = []
-        issues = response_text.strip().split('---')
-        for issue_block in issues:
-            if not issue_block.strip(): continue
-            current_issue = {}
-            for line in issue_block.strip().split('\n'):
-                line = line.replace('**', '') # マークダウンの**を除去
-                if ':' in line:
-                    key, value = line.split(':', 1)
-                    key = key.strip().replace('-', '').strip()
-                    value = value.strip()
-                    if key == "種類": current_issue['type'] = f"AI: {value}"
-                    elif key == "行番号": current_issue['line'] = int(re.search(r'\d+', value).group()) if re.search(r'\d+', value) else 0
-                    elif key == "問題箇所": current_issue['text'] = value
-                    elif key == "修正案": current_issue['message'] = f"提案: {value}"
-                    elif key == "理由": current_issue['message'] = f"{current_issue.get('message', '')} ({value})"
-            if 'type' in current_issue:
-                current_issue.setdefault('message', 'AIによる指摘')
-                error_types = ['誤字', '文法エラー', '脱字']
-                is_error = any(err_type in current_issue['type'] for err_type in error_types)
-                current_issue['severity'] = 'error' if is_error else 'suggestion'
-                results.append(current_issue)
-        return results
+# --- UI用の補助関数 ---
+STREAM_RENDER_INTERVAL = 0.3  # ストリーミング表示を更新する最短間隔 (秒)
+
+
+RESULT_COLUMNS = ['line', 'position', 'severity', 'type', 'text', 'message', 'replacement']
+SEVERITY_LABELS = {'error': '🔴 重大な指摘', 'suggestion': '🟡 改善提案'}
+RESULT_VIEWS = ['カード表示', '表形式', '種類別サマリー']
+RESULT_PAGE_SIZES = [20, 50, 100, 200]
+AUTOFIX_PREVIEW_LINES = 400  # 画面に表示する差分の最大行数 (全体はダウンロードで確認する)
+
+
+def sort_results(results):
+    return sorted(results, key=lambda x: (x.get('line', 0), x.get('severity', 'suggestion') == 'error'))
+
+
+def results_to_frame(results):
+    # 指摘の辞書のリストを列指向の DataFrame に変換する。
+    # 種類・重要度はカテゴリ型にして、数万件でもメモリと描画の負担を抑える
+    import pandas as pd
+
+    frame = pd.DataFrame.from_records(list(results), columns=RESULT_COLUMNS)
+    frame['line'] = frame['line'].fillna(0).astype('int64')
+    frame['position'] = frame['position'].fillna(-1).astype('int64')
+    frame['text'] = frame['text'].fillna('')
+    frame['message'] = frame['message'].fillna('')
+    # 自動修正の置換後の文字列。修正案のない指摘は None のままにする (空文字は削除を表す)
+    frame['replacement'] = frame['replacement'].astype(object).where(frame['replacement'].notna(), None)
+    frame['type'] = frame['type'].fillna('指摘').astype('category')
+    frame['severity'] = frame['severity'].fillna('suggestion').astype('category')
+    return frame
+
+
+def render_result_cards(frame, first_number):
+    # 表示中のページの指摘だけを、1回の st.markdown でまとめて描画する
+    cards = []
+    for number, r in enumerate(frame.itertuples(index=False), first_number):
+        css_class = "error-card" if r.severity == 'error' else "suggestion-card"
+        cards.append(f"""
+                <div class="result-card {css_class}">
+                    <strong>{number}. [{html.escape(r.type)}] 行番号: {r.line or '不明'}</strong><br>
+                    <b>問題箇所:</b> <code>{html.escape(r.text)}</code><br>
+                    <b>詳細:</b> {html.escape(r.message).replace(chr(10), '<br>')}
+                </div>""")
+    st.markdown(''.join(cards), unsafe_allow_html=True)
+
+
+def render_results(frame):
+    severity_counts = frame['severity'].value_counts()
+    scol1, scol2 = st.columns(2)
+    scol1.metric("🔴 重大な指摘 (要修正)", int(severity_counts.get('error', 0)))
+    scol2.metric("🟡 改善提案", int(severity_counts.get('suggestion', 0)))
+
+    type_options = sorted(frame['type'].unique())
+    if 'result_types' in st.session_state:
+        # 再校正で消えた種類が選択に残っているとエラーになるため取り除く
+        st.session_state['result_types'] = [t for t in st.session_state['result_types'] if t in type_options]
+
+    fcol1, fcol2, fcol3 = st.columns([2, 1, 1])
+    types = fcol1.multiselect("種類で絞り込む", type_options, key='result_types')
+    severities = fcol2.multiselect("重要度で絞り込む", list(SEVERITY_LABELS), format_func=SEVERITY_LABELS.get, key='result_severities')
+    view = fcol3.radio("表示形式", RESULT_VIEWS, key='result_view')
+
+    filtered = frame
+    if types:
+        filtered = filtered[filtered['type'].isin(types)]
+    if severities:
+        filtered = filtered[filtered['severity'].isin(severities)]
+    if filtered.empty:
+        st.info("条件に一致する指摘はありません。")
+        return
+
+    if view == '種類別サマリー':
+        # 種類 → 件数 → 該当行の例
+        summary = filtered.groupby('type', observed=True).agg(
+            件数=('line', 'size'),
+            該当行の例=('line', lambda lines: ', '.join(str(line) for line in lines.drop_duplicates().head(10))),
+        ).sort_values('件数', ascending=False)
+        st.dataframe(summary, use_container_width=True)
+        return
+
+    if view == '表形式':
+        # st.dataframe は表示範囲だけを描画するため、全件をそのまま渡す
+        st.dataframe(filtered, use_container_width=True, hide_index=True)
+        return
+
+    pcol1, pcol2 = st.columns(2)
+    page_size = pcol1.selectbox("1ページの件数", RESULT_PAGE_SIZES, key='result_page_size')
+    page_count = (len(filtered) - 1) // page_size + 1
+    # 件数や絞り込みが変わるとページ数も変わり、ウィジェットは1ページ目に戻る
+    page = pcol2.number_input(f"ページ (全 {page_count} ページ)", min_value=1, max_value=page_count, value=1)
+    first = (page - 1) * page_size
+    st.caption(f"{len(filtered)} 件中 {first + 1}〜{min(first + page_size, len(filtered))} 件目を表示")
+    render_result_cards(filtered.iloc[first:first + page_size], first + 1)
+
+
+def adopt_fixed_text():
+    # 修正後のテキストを校正対象に反映する (ウィジェットの値を書き換えるため on_click で呼ぶ)。
+    # 指摘の位置は修正前のテキストのものなので、校正結果はいったん閉じる
+    st.session_state['script_text'] = st.session_state['autofix']['text']
+    st.session_state['autofix'] = None
+    st.session_state['run_check'] = False
+
+
+def render_autofix(frame):
+    fixable = frame[frame['replacement'].notna()]
+    if fixable.empty:
+        return
+    with st.expander(f"🛠 自動修正（修正案のある指摘 {len(fixable)} 件）"):
+        type_options = sorted(fixable['type'].unique())
+        fix_types = st.multiselect("修正する種類", type_options, default=type_options)
+        if st.button("修正案をまとめて適用する", use_container_width=True, disabled=not fix_types):
+            with tracer.span('apply_fixes', issues=len(fixable)):
+                st.session_state['autofix'] = apply_fixes(st.session_state['script_text'], fixable.to_dict('records'), types=set(fix_types))
+        fix = st.session_state['autofix']
+        if fix is None:
+            return
+        st.caption(f"適用 {len(fix['applied'])} 件 ・ 見送り {len(fix['skipped'])} 件")
+        if fix['skipped']:
+            st.dataframe([{'行番号': r.get('line'), '種類': r.get('type'), '問題箇所': r.get('text'), '理由': r['reason']}
+                          for r in fix['skipped']], use_container_width=True, hide_index=True)
+        if not fix['diff']:
+            st.info("変更はありません。")
+            return
+        diff_lines = fix['diff'].split('\n')
+        st.code('\n'.join(diff_lines[:AUTOFIX_PREVIEW_LINES]), language='diff')
+        if len(diff_lines) > AUTOFIX_PREVIEW_LINES:
+            st.caption(f"差分 {len(diff_lines)} 行のうち先頭 {AUTOFIX_PREVIEW_LINES} 行を表示しています。")
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        c1, c2, c3 = st.columns(3)
+        c1.download_button("💾 差分をダウンロード (.diff)", data=fix['diff'], file_name=f"台本_修正_{timestamp}.diff",
+                           mime="text/x-diff", use_container_width=True)
+        c2.download_button("💾 修正後の台本 (.txt)", data=fix['text'], file_name=f"台本_修正後_{timestamp}.txt",
+                           mime="text/plain", use_container_width=True)
+        c3.button("✏️ 校正対象テキストに反映", on_click=adopt_fixed_text, use_container_width=True)
+
+
+def render_metrics_panel():
+    # 段階・ルールごとの処理時間、Gemini の呼び出し (トークン数・待ち時間)、キャッシュのヒット率
+    # (プロセス全体の集計で、ほかのセッションの処理も含む)
+    with st.expander("📊 計測 (処理時間・トークン)"):
+        profiling = st.toggle("プロファイリング (cProfile)", value=tracer.profiling,
+                              help="各処理の関数ごとの時間を計測します。計測中は処理が遅くなります。")
+        tracer.set_profiling(profiling)
+        spans = tracer.span_summary()
+        if not spans:
+            st.caption("まだ計測結果はありません。")
+            return
+        gemini = next((row for row in spans if row['name'] == 'gemini'), None)
+        if gemini is not None:
+            st.caption(f"Gemini: {gemini['count']} 回 ・ 入力 {gemini.get('prompt_tokens', 0):,} / 出力 {gemini.get('output_tokens', 0):,} トークン ・ "
+                       f"p50 {gemini['p50_ms'] / 1000:.1f} 秒 / p99 {gemini['p99_ms'] / 1000:.1f} 秒")
+        for counter in tracer.counter_summary():
+            if 'hit_rate' in counter:
+                st.caption(f"{counter['name']}: ヒット率 {counter['hit_rate']:.0%}（{counter.get('hit', 0)} / {counter.get('hit', 0) + counter.get('miss', 0)}）")
+        st.dataframe([{'処理': row['name'], '回数': row['count'], '合計 (ms)': row['total_ms'], 'p50 (ms)': row['p50_ms'],
+                       'p99 (ms)': row['p99_ms']} for row in spans], use_container_width=True, hide_index=True)
+        report = tracer.profile_report() if profiling else ''
+        if report:
+            st.code(report, language=None)
+        c1, c2 = st.columns(2)
+        c1.download_button("💾 JSONL", data=tracer.export_jsonl(), file_name=f"trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                           mime="application/x-ndjson", use_container_width=True)
+        if c2.button("リセット", use_container_width=True):
+            tracer.reset()
+
+
+def generate_script_streaming(assistant, plot, length_minutes=8, by_section=False):
+    # 届いたテキストをその場で表示しつつ、改行で確定した行から基本チェックを進める
+    # by_section=True のときは起承転結のパートごとに並行して生成する
+    checker = current_proofreading_tool().streaming_checker()
+    preview = st.empty()
+    status = st.empty()
+    parts = []
+    last_render = 0.0
+    if by_section:
+        stream = assistant.create_script_sections(plot, length_minutes, stream=True)
+    else:
+        stream = assistant.create_script(plot, length_minutes, stream=True)
+    with tracer.span('generate_script_streaming', length_minutes=length_minutes, by_section=by_section) as attrs:
+        for chunk in stream:
+            parts.append(chunk)
+            checker.feed(chunk)
+            now = time.monotonic()
+            if now - last_render >= STREAM_RENDER_INTERVAL:
+                preview.text(''.join(parts))
+                status.caption(f"生成中... {len(checker.lines)} 行 ・ 基本チェックの指摘 {checker.issue_count} 件")
+                last_render = now
+        attrs['chars'] = sum(len(part) for part in parts)
+    preview.empty()
+    status.empty()
+    if not parts:
+        return False
+    if stream.error is not None:
+        # 途中で途切れた台本は完成として保存しない (前に生成した台本もそのまま残す)
+        with st.expander(f"途中まで生成された台本 ({attrs['chars']:,} 文字・保存されていません)"):
+            st.text(''.join(parts))
+        return False
+    checker.finish()
+    st.session_state['generated_script'] = ''.join(parts)
+    st.session_state['generated_length'] = length_minutes
+    st.session_state['generated_check'] = checker.state()
+    return True
+
 
 # --- UI描画 ---
 st.markdown('<h1 class="main-header">🎬 AI台本作家 & 校正ツール</h1>', unsafe_allow_html=True)
@@ -217,7 +368,36 @@ with st.sidebar:
     else:
         st.warning("APIキーを入力すると全機能が利用可能になります。")
     
-    st.info("このツールは入力されたAPIキーをサーバーに保存しません。", icon="🔒")
+    st.info("このツールは入力されたAPIキーをサーバーに保存しません (キーごとの接続も1時間でメモリーから破棄します)。", icon="🔒")
+    st.markdown("---")
+    st.header("🗃️ AI応答キャッシュ")
+    response_cache = get_response_cache()
+    bypass_cache = st.checkbox("キャッシュを使わずに再生成する", value=False, help="同じ内容でも Gemini に問い合わせ直し、新しい結果を取得します。")
+    cache_stats = response_cache.stats()
+    st.caption(f"ヒット: {cache_stats['hits']} / ミス: {cache_stats['misses']} (ヒット率 {cache_stats['hit_rate']:.0%}) ・ 保存件数: {cache_stats['entries']}")
+    if st.button("キャッシュを消去する", use_container_width=True):
+        response_cache.clear()
+        st.success("キャッシュを消去しました。")
+    if api_key:
+        scheduler_stats = get_scheduler(api_key).stats()
+        st.caption(f"AIリクエスト: 送信 {scheduler_stats['requests']} / 実行中 {scheduler_stats['running']} / "
+                   f"待機中 {scheduler_stats['queued']} / 再試行 {scheduler_stats['retries']} / 相乗り {scheduler_stats['coalesced']}")
+    st.markdown("---")
+    st.header("📚 ユーザー辞書")
+    dictionary_registry = get_dictionary_registry()
+    user_dictionaries = dictionary_registry.refresh()
+    if user_dictionaries:
+        for dictionary in user_dictionaries:
+            kind = "NGワード" if dictionary.is_ng else "表記統一"
+            st.caption(f"{dictionary.name}（{kind}・{len(dictionary):,} 件）")
+    else:
+        st.caption("dictionaries フォルダに TSV / JSON の辞書を置くと、基本チェックで表記統一・NGワードを検出します。")
+    # 読めなかった辞書ファイルや読み飛ばした項目は、アプリを止めずに警告だけ出す
+    for problem in dictionary_registry.problems():
+        st.warning(problem, icon="⚠️")
+    st.markdown("---")
+    # 計測パネルは、このあとの処理の結果まで含めて表示するため、スクリプトの最後で描画する
+    metrics_panel = st.container()
     st.markdown("---")
     st.header("📖 ツール説明")
     st.markdown("""
@@ -244,13 +424,21 @@ with tab1:
     st.subheader("✍️ ステップ1: 制作モードを選択")
     mode = st.radio(
         "どの方法で台本を作成しますか？",
-        ('フルオート', 'セミオート', '持ち込みプロット'),
+        ('フルオート', 'セミオート', '持ち込みプロット', '一括生成'),
         horizontal=True,
-        captions=['テーマだけで全自動生成', 'AIと対話しつつ段階的に作成', '自作のプロットから台本化']
+        captions=['テーマだけで全自動生成', 'AIと対話しつつ段階的に作成', '自作のプロットから台本化', 'CSV / JSONL から大量に生成']
     )
+    if mode != '一括生成':
+        lcol1, lcol2 = st.columns(2)
+        with lcol1:
+            script_length = st.slider("台本の長さ（分）", min_value=3, max_value=30, value=8)
+        with lcol2:
+            by_section = st.checkbox(
+                "起承転結ごとに並行して生成する", value=script_length >= SECTION_GENERATION_MINUTES,
+                help="長い台本を起・承・転・結のパートに分けて同時に生成し、1本につなぎます。プロットから起承転結を読み取れない場合は一括で生成します。")
     st.markdown("---")
 
-    assistant = AiAssistant(api_key)
+    assistant = get_assistant(api_key, not bypass_cache)
 
     if mode == 'フルオート':
         st.subheader("🚀 フルオートモード")
@@ -270,13 +458,10 @@ with tab1:
                 
                 if st.session_state['generated_plot']:
                     st.text_area("生成されたプロット", value=st.session_state['generated_plot'], height=200, disabled=True)
-                    with st.spinner("台本を生成中..."):
-                        script = assistant.create_script(st.session_state['generated_plot'])
-                        if script:
-                            st.session_state['generated_script'] = script
-                            st.success("台本が完成しました！")
-                        else:
-                            st.error("台本の生成に失敗しました。")
+                    if generate_script_streaming(assistant, st.session_state['generated_plot'], script_length, by_section):
+                        st.success("台本が完成しました！")
+                    else:
+                        st.error("台本の生成に失敗しました。")
     
     elif mode == 'セミオート':
         st.subheader("🤝 セミオートモード")
@@ -301,13 +486,10 @@ with tab1:
             st.info("左側のプロットを自由に編集した後、下のボタンを押して台本を作成してください。")
             if st.button("このプロットで台本を生成する", type="primary", use_container_width=True):
                 if st.session_state['generated_plot']:
-                    with st.spinner("台本を生成中..."):
-                        script = assistant.create_script(st.session_state['generated_plot'])
-                        if script:
-                            st.session_state['generated_script'] = script
-                            st.success("台本が完成しました！")
-                        else:
-                            st.error("台本の生成に失敗しました。")
+                    if generate_script_streaming(assistant, st.session_state['generated_plot'], script_length, by_section):
+                        st.success("台本が完成しました！")
+                    else:
+                        st.error("台本の生成に失敗しました。")
                 else:
                     st.warning("先にプロットを生成または入力してください。")
 
@@ -316,26 +498,94 @@ with tab1:
         st.text_area("ここに自作のプロットやアイデアを貼り付けてください", height=300, key='generated_plot')
         if st.button("このプロットで台本を生成する", type="primary", use_container_width=True):
             if st.session_state['generated_plot']:
-                 with st.spinner("台本を生成中..."):
-                    script = assistant.create_script(st.session_state['generated_plot'])
-                    if script:
-                        st.session_state['generated_script'] = script
-                        st.success("台本が完成しました！")
-                    else:
-                        st.error("台本の生成に失敗しました。")
+                if generate_script_streaming(assistant, st.session_state['generated_plot'], script_length, by_section):
+                    st.success("台本が完成しました！")
+                else:
+                    st.error("台本の生成に失敗しました。")
             else:
                 st.warning("プロットを入力してください。")
 
+    elif mode == '一括生成':
+        st.subheader("🏭 一括生成モード")
+        st.caption("genre, theme, length_minutes 列（任意で id 列）を持つ CSV / JSONL から、プロット → 台本 → 校正をまとめて行います。")
+        uploaded_jobs = st.file_uploader("ジョブファイル", type=['csv', 'jsonl'])
+        c1, c2 = st.columns(2)
+        with c1:
+            batch_concurrency = st.slider("同時に処理する行数", min_value=1, max_value=8, value=4)
+        with c2:
+            batch_ai_check = st.checkbox("AIチェックも行う", value=False, help="基本チェックに加えて、台本ごとにAIチェックを行います。")
+
+        jobs = None
+        if uploaded_jobs is not None:
+            input_format = 'jsonl' if uploaded_jobs.name.endswith('.jsonl') else 'csv'
+            try:
+                jobs = parse_jobs(uploaded_jobs.getvalue().decode('utf-8-sig'), input_format)
+            except ValueError as e:
+                st.error(f"ジョブファイルを読み込めませんでした: {e}")
+        if jobs is not None:
+            batch_dir = os.path.join(BATCH_OUTPUT_DIR, os.path.splitext(os.path.basename(uploaded_jobs.name))[0])
+            st.caption(f"{len(jobs)} 行 ・ 出力先: {batch_dir}（同じファイル名で再実行すると、完了済みの行を飛ばして続きから再開します）")
+
+            if st.button("一括生成を開始する", type="primary", use_container_width=True):
+                progress_bar = st.progress(0.0, text="準備中...")
+
+                def show_batch_progress(progress):
+                    completed = progress['done'] + progress['failed'] + progress['skipped']
+                    progress_bar.progress(completed / progress['total'] if progress['total'] else 1.0, text=format_progress(progress))
+
+                pipeline = BatchPipeline(assistant, current_proofreading_tool(), batch_dir,
+                                         concurrency=batch_concurrency, ai_check=batch_ai_check)
+                batch_progress = pipeline.run(jobs, on_progress=show_batch_progress)
+                if batch_progress['failed']:
+                    st.warning(f"{batch_progress['failed']} 件の生成に失敗しました。もう一度実行すると失敗した行だけをやり直します。")
+                else:
+                    st.success("一括生成が完了しました！")
+
+            batch_records = read_checkpoint(batch_dir)
+            if batch_records:
+                st.dataframe(
+                    [{'ID': r['id'], '状態': '完了' if r['status'] == 'done' else '失敗', 'ジャンル': r['genre'], 'テーマ': r['theme'],
+                      '目標 (分)': r.get('length_minutes'), '推定 (分)': r.get('estimated_minutes'),
+                      '指摘': r.get('issue_count'), '要修正': r.get('error_count'), '秒': r.get('elapsed'), 'エラー': r.get('error', '')}
+                     for r in sorted(batch_records.values(), key=lambda r: r['id'])],
+                    use_container_width=True, hide_index=True)
+                # 完了した台本と校正結果をまとめてダウンロードできるようにする
+                archive = io.BytesIO()
+                with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zf:
+                    zf.write(os.path.join(batch_dir, CHECKPOINT_NAME), CHECKPOINT_NAME)
+                    for record in batch_records.values():
+                        if record['status'] != 'done':
+                            continue
+                        for name in ('plot.txt', 'script.txt', 'issues.jsonl'):
+                            path = os.path.join(batch_dir, record['id'], name)
+                            if os.path.exists(path):
+                                zf.write(path, f"{record['id']}/{name}")
+                st.download_button("💾 成果物をまとめてダウンロード (.zip)", data=archive.getvalue(),
+                                   file_name=f"{os.path.basename(batch_dir)}.zip", mime="application/zip", use_container_width=True)
+
     # 生成された台本の表示エリア
     if st.session_state['generated_script']:
         st.markdown("---")
         st.subheader("🎉 完成した台本")
         st.text_area("生成された台本（コピー＆ペーストして利用できます）", value=st.session_state['generated_script'], height=400)
+        target_minutes = st.session_state.get('generated_length')
+        estimate, length_issue = current_proofreading_tool().estimate_length(st.session_state['generated_script'], target_minutes)
+        length_caption = f"推定の尺: 約{estimate['seconds'] / 60:.1f}分（{estimate['turns']} ターン ・ 読み上げ {estimate['spoken_chars']} 文字）"
+        if length_issue is not None:
+            st.warning(f"{length_caption} ― {length_issue['message']}")
+        else:
+            st.caption(length_caption + (f" ・ 目標 {target_minutes} 分" if target_minutes else ""))
         
         c1, c2 = st.columns(2)
         with c1:
             if st.button("🔄 この台本を校正ツールに送る", use_container_width=True):
                 st.session_state['script_text'] = st.session_state['generated_script']
+                generated_check = st.session_state['generated_check']
+                if generated_check and generated_check['lines'] == st.session_state['generated_script'].split('\n'):
+                    # 生成中に済ませた基本チェックの結果を、そのまま校正結果として引き継ぐ
+                    st.session_state['check_state']['basic'] = dict(generated_check)
+                    st.session_state['results'] = results_to_frame(sort_results(r for results in generated_check['results'] for r in results))
+                    st.session_state['run_check'] = True
                 st.success("台本を校正ツールに転送しました。上の「台本校正ツール」タブに切り替えて確認してください。")
         with c2:
             st.download_button(
@@ -363,39 +613,37 @@ with tab2:
             if not st.session_state['script_text'].strip():
                 st.warning("校正するテキストを入力してください。")
             else:
-                tool = ScriptProofreadingTool()
+                tool = current_proofreading_tool()
+                check_state = st.session_state['check_state']
                 all_results = []
                 with st.spinner("チェック中..."):
                     if use_basic_check:
-                        all_results.extend(tool.perform_basic_check(st.session_state['script_text']))
+                        all_results.extend(tool.perform_basic_check(st.session_state['script_text'], state=check_state['basic']))
                     if use_ai_check:
-                        all_results.extend(tool.perform_ai_check(st.session_state['script_text'], api_key))
+                        all_results.extend(tool.perform_ai_check(st.session_state['script_text'], assistant=get_assistant(api_key, not bypass_cache), state=check_state['ai'], on_error=st.error))
                 
-                all_results.sort(key=lambda x: (x.get('line', 0), x.get('severity', 'suggestion') == 'error'), reverse=False)
-                st.session_state['results'] = all_results
+                st.session_state['results'] = results_to_frame(sort_results(all_results))
                 st.session_state['run_check'] = True
-                st.success("校正が完了しました！")
+                st.session_state['autofix'] = None
+                summary = []
+                if use_basic_check:
+                    summary.append(f"基本チェック {check_state['basic']['rechecked_lines']} 行")
+                if use_ai_check and 'requested_chunks' in check_state['ai']:
+                    summary.append(f"AIチェック {check_state['ai']['requested_chunks']} チャンク")
+                st.success(f"校正が完了しました！（再チェック: {' / '.join(summary)}）" if summary else "校正が完了しました！")
 
     if st.session_state['run_check']:
         st.markdown("---")
         st.subheader("📋 校正結果")
         results = st.session_state['results']
-        if not results:
+        if results is None or results.empty:
             st.success("🎉 素晴らしい！問題は見つかりませんでした。")
         else:
-            errors = [r for r in results if r.get('severity') == 'error']
-            suggestions = [r for r in results if r.get('severity') == 'suggestion']
-            
-            scol1, scol2 = st.columns(2)
-            scol1.metric("🔴 重大な指摘 (要修正)", len(errors))
-            scol2.metric("🟡 改善提案", len(suggestions))
-            
-            for i, r in enumerate(results, 1):
-                css_class = "error-card" if r.get('severity') == 'error' else "suggestion-card"
-                st.markdown(f"""
-                <div class="result-card {css_class}">
-                    <strong>{i}. [{r.get('type', '指摘')}] 行番号: {r.get('line', '不明')}</strong><br>
-                    <b>問題箇所:</b> <code>{html.escape(r.get('text', ''))}</code><br>
-                    <b>詳細:</b> {html.escape(r.get('message', '')).replace(chr(10), '<br>')}
-                </div>
-                """, unsafe_allow_html=True)
+            with tracer.span('render_results', rows=len(results)):
+                render_results(results)
+            render_autofix(results)
+
+
+# --- 計測パネル (サイドバー) ---
+with metrics_panel:
+    render_metrics_panel()
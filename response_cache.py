@@ -0,0 +1,145 @@
+# response_cache.py (AI応答キャッシュ)
+#
+# モデル名とプロンプトのハッシュをキーに、生成結果を2層で保持する。
+# - メモリ層: 直近に使った応答を LRU で保持
+# - ディスク層: SQLite に保存し、プロセスを再起動しても再利用する
+# 有効期限 (TTL) と件数上限を超えた応答は破棄する。
+# メモリ層で見つかった応答も最後に使った時刻をディスク層に反映する (ディスク層の LRU で消されないように)。
+# 書き込みは溜めておき、件数か経過時間が一定を超えたとき、または件数上限で削除する前にまとめて行う。
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+# メモリ層で使った応答の時刻を、ディスク層へまとめて書き込む件数と間隔 (秒)
+ACCESS_FLUSH_ENTRIES = 64
+ACCESS_FLUSH_SECONDS = 30.0
+
+
+class ResponseCache:
+    def __init__(self, path=None, ttl_seconds=7 * 24 * 60 * 60, max_entries=5000, memory_entries=256):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        # ディスク層へまだ書き込んでいない、メモリ層で使った時刻 {キー: 時刻}
+        self._accessed = {}
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Streamlit のスクリプトスレッドやワーカースレッドから共有するため、ロックで直列化する
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, model TEXT, response TEXT, created_at REAL, accessed_at REAL)')
+            self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+            self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, prompt):
+        return hashlib.sha256(f"{model_name}\0{prompt}".encode('utf-8')).hexdigest()
+
+    def _is_fresh(self, created_at, now):
+        return self.ttl_seconds is None or now - created_at < self.ttl_seconds
+
+    def _remember(self, key, response, created_at):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_accessed(self):
+        # ロックを持った状態で呼ぶ (commit は呼び出し側で行う)
+        if self._accessed:
+            self._conn.executemany('UPDATE responses SET accessed_at = MAX(accessed_at, ?) WHERE key = ?',
+                                   [(accessed_at, key) for key, accessed_at in self._accessed.items()])
+            self._accessed.clear()
+        self._last_flush = time.monotonic()
+
+    def get(self, model_name, prompt):
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_fresh(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    if self._conn is not None:
+                        self._accessed[key] = now
+                        if (len(self._accessed) >= ACCESS_FLUSH_ENTRIES
+                                or time.monotonic() - self._last_flush >= ACCESS_FLUSH_SECONDS):
+                            self._flush_accessed()
+                            self._conn.commit()
+                    return entry[0]
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    'SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    if self._is_fresh(row[1], now):
+                        self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+                        self._conn.commit()
+                        self._remember(key, row[0], row[1])
+                        self.hits += 1
+                        return row[0]
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self._conn.commit()
+
+            self.misses += 1
+            return None
+
+    def set(self, model_name, prompt, response):
+        key = self.make_key(model_name, prompt)
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            if self._conn is None:
+                return
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, model, response, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                (key, model_name, response, now, now))
+            if self.ttl_seconds is not None:
+                self._conn.execute('DELETE FROM responses WHERE created_at < ?', (now - self.ttl_seconds,))
+            # 件数上限を超えた分は、最後に使われた時刻が古いものから削除する
+            # (メモリ層で使った時刻を先に書き込んでおく)
+            self._flush_accessed()
+            self._conn.execute(
+                'DELETE FROM responses WHERE key IN ('
+                'SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._accessed.clear()
+            self.hits = 0
+            self.misses = 0
+            if self._conn is not None:
+                self._conn.execute('DELETE FROM responses')
+                self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            if self._conn is not None:
+                entries = self._conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            else:
+                entries = len(self._memory)
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'entries': entries,
+            }
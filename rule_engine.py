@@ -0,0 +1,194 @@
+# rule_engine.py (基本チェック用 コンパイル済みルールエンジン)
+#
+# 行 × パターンの二重ループで re.finditer を呼ぶ代わりに、
+# ルールを一度だけコンパイルしてテキスト全体を1パスで走査する。
+# 行番号・桁位置は行頭オフセットの索引 (bisect) から求める。
+
+import re
+import unicodedata
+from bisect import bisect_right
+from operator import itemgetter
+
+from tracing import tracer
+
+# 基本チェックのルール定義
+# テキスト全体を一度に走査するため、空白の連続には改行を含めない
+# replacement は自動修正の置換後の文字列 (正規表現のルールでは \1 などのグループ参照を使える)、
+# normalize は置換の代わりに行う Unicode 正規化の形式。どちらもないルールは自動修正しない
+BASIC_PATTERNS = [
+    {'pattern': r'([。、])[。、]+', 'type': '句読点重複', 'message': '句読点が重複しています', 'replacement': r'\1'},
+    {'pattern': r'[!?！？]{2,}', 'type': '感嘆符重複', 'message': '感嘆符や疑問符が重複しています'},
+    {'pattern': r'([^\S\n])[^\S\n]+', 'type': '空白重複', 'message': '不要な空白が連続しています', 'replacement': r'\1'},
+    {'pattern': r'[ａ-ｚＡ-Ｚ０-９]', 'type': '全角英数字', 'message': '全角英数字が使用されています。半角に統一することを推奨します', 'normalize': 'NFKC'},
+    {'pattern': r'という事', 'type': '表記統一', 'message': '「という事」はひらがなで「ということ」と書くのが一般的です', 'replacement': 'ということ'},
+    {'pattern': r'出来る', 'type': '表記統一', 'message': '補助動詞の「できる」はひらがなで書くのが一般的です', 'replacement': 'できる'},
+    {'pattern': r'見れる', 'type': 'ら抜き言葉', 'message': '「見れる」は「見られる」が正しい表現です', 'replacement': '見られる'},
+]
+
+# 正規表現のメタ文字を含まないパターンは固定文字列として扱う
+_REGEX_META = set('.^$*+?{}[]\\|()')
+
+# 「[文字クラス]{n,}」形式のパターン
+_REPEATED_CLASS = re.compile(r'^(\[(?:\\.|[^\]\\])+\])\{(\d+),\}$')
+
+
+class LineIndex:
+    # テキスト中のオフセットを (行番号, 行内位置) に変換する索引
+    def __init__(self, text):
+        starts = [0]
+        find = text.find
+        pos = find('\n')
+        while pos != -1:
+            starts.append(pos + 1)
+            pos = find('\n', pos + 1)
+        self.starts = starts
+
+    def locate(self, offset):
+        line_idx = bisect_right(self.starts, offset) - 1
+        return line_idx + 1, offset - self.starts[line_idx]
+
+
+def _optimize_pattern(pattern):
+    # [。、]{2,} を [。、][。、]{1,} に書き換える。
+    # 先頭が単独の文字クラスになると re の前方探索が効き、走査が速くなる
+    match = _REPEATED_CLASS.match(pattern)
+    if match and int(match.group(2)) >= 2:
+        char_class = match.group(1)
+        return f'{char_class}{char_class}{{{int(match.group(2)) - 1},}}'
+    return pattern
+
+
+class CompiledRuleSet:
+    def __init__(self, patterns):
+        self.rules = []
+        for order, pattern_info in enumerate(patterns):
+            pattern = pattern_info['pattern']
+            is_literal = not any(ch in _REGEX_META for ch in pattern)
+            self.rules.append({
+                'order': order,
+                'literal': pattern if is_literal else None,
+                # 行単位の照合と同じ結果になるよう ^ $ は行頭・行末にマッチさせる
+                'regex': None if is_literal else re.compile(_optimize_pattern(pattern), re.MULTILINE),
+                'type': pattern_info['type'],
+                'message': pattern_info['message'],
+                'replacement': pattern_info.get('replacement'),
+                'normalize': pattern_info.get('normalize'),
+            })
+
+    def _scan_literal(self, text, literal):
+        # 固定文字列は str.find で探す (含まれない場合は1回の走査で終わる)
+        step = len(literal)
+        pos = text.find(literal)
+        while pos != -1:
+            yield pos, literal, None
+            pos = text.find(literal, pos + step)
+
+    def _scan_regex(self, text, regex):
+        for match in regex.finditer(text):
+            yield match.start(), match.group(), match
+
+    def _replacement(self, rule, matched, match):
+        # 自動修正の置換後の文字列 (修正できないルールでは None)
+        if rule['normalize'] is not None:
+            return unicodedata.normalize(rule['normalize'], matched)
+        if rule['replacement'] is None or match is None:
+            return rule['replacement']
+        return match.expand(rule['replacement'])
+
+    def check(self, text, first_line=1, line_starts=None, skip=None):
+        # line_starts に LineIndex(text).starts を渡すと、索引の作成を省略する
+        # skip (オフセットを受け取る関数) が真を返す位置の一致は指摘しない (顔文字やスラングの中など)
+        starts = line_starts if line_starts is not None else LineIndex(text).starts
+        stride = len(self.rules)
+        found = []
+        append = found.append
+        for rule in self.rules:
+            if rule['literal'] is not None:
+                matches = self._scan_literal(text, rule['literal'])
+            else:
+                matches = self._scan_regex(text, rule['regex'])
+            order, rule_type, message = rule['order'], rule['type'], rule['message']
+            fixable = rule['replacement'] is not None or rule['normalize'] is not None
+            with tracer.span(f"rule:{rule_type}"):
+                for start, matched, match in matches:
+                    if skip is not None and skip(start):
+                        continue
+                    line_idx = bisect_right(starts, start) - 1
+                    position = start - starts[line_idx]
+                    result = {'type': rule_type, 'line': line_idx + first_line, 'position': position,
+                              'text': matched, 'message': message, 'severity': 'suggestion'}
+                    if fixable:
+                        result['replacement'] = self._replacement(rule, matched, match)
+                    append((line_idx * stride + order, result))
+
+        # 従来の出力順 (行 → パターン定義順 → 出現位置) に並べ直す
+        # 各ルールの一致は出現位置順に追加されるので、安定ソートで位置順も保たれる
+        found.sort(key=itemgetter(0))
+        return [item[1] for item in found]
+
+
+class StreamingLineChecker:
+    # 生成途中のテキストを受け取り、改行で確定した行から順にチェックする。
+    # check は (text, first_line) を受け取り結果のリストを返す関数。
+    # is_unit_start を渡すと、行をまとまり (ユニット) ごとにためて、次のユニットが始まった時点でチェックする
+    # (括弧の対応など、複数行にまたがるチェックのため)。
+    # lines / line_results は ScriptProofreadingTool.perform_basic_check の state と同じ形式
+    def __init__(self, check, version=None, is_unit_start=None):
+        self.check = check
+        self.version = version
+        self.is_unit_start = is_unit_start
+        self.lines = []
+        self.line_results = []
+        self.issue_count = 0
+        # 改行がまだ届いていない行の断片。長い行が細かく届いても毎回つなぎ直さないよう、リストにためておく
+        self._pending = []
+        self._checked_lines = 0
+
+    def _check_unit(self):
+        # まだチェックしていない行をまとめてチェックする
+        first = self._checked_lines
+        if first == len(self.lines):
+            return []
+        results = self.check('\n'.join(self.lines[first:]), first_line=first + 1)
+        self.line_results.extend([] for _ in range(len(self.lines) - first))
+        for r in results:
+            self.line_results[r['line'] - 1].append(r)
+        self._checked_lines = len(self.lines)
+        self.issue_count += len(results)
+        return results
+
+    def _add_line(self, line):
+        results = []
+        if self.is_unit_start is None or self.is_unit_start(line):
+            results = self._check_unit()
+        self.lines.append(line)
+        if self.is_unit_start is None:
+            results = self._check_unit()
+        return results
+
+    def feed(self, text):
+        head, *rest = text.split('\n')
+        if head:
+            self._pending.append(head)
+        if not rest:
+            return []
+        # 改行が届いたら、ためておいた断片をつないで1行にする
+        completed = [''.join(self._pending), *rest[:-1]]
+        self._pending = [rest[-1]] if rest[-1] else []
+        new_results = []
+        for line in completed:
+            new_results.extend(self._add_line(line))
+        return new_results
+
+    def finish(self):
+        # 最後の (改行で終わらない) 行を確定させる
+        results = self._add_line(''.join(self._pending))
+        self._pending = []
+        return results + self._check_unit()
+
+    def state(self):
+        return {'version': self.version, 'lines': list(self.lines), 'results': list(self.line_results),
+                'rechecked_lines': len(self.lines)}
+
+    def results(self):
+        return [r for results in self.line_results for r in results]
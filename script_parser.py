@@ -0,0 +1,277 @@
+# script_parser.py (2ch風台本の字句解析)
+#
+# 台本を1回の走査で字句に分け、各チェックが共通で使う構造 (ScriptDocument) を作る。
+# - 話者ターン: 「N:」「イッチ:」「名無しA:」などで始まる行と、それに続く行
+# - 演出指示: 【画像: 〇〇】【テロップ: 〇〇】
+# - 括弧: 「」『』（）【】 をスタックで対応付ける (同じターンの中なら行をまたいでもよい)
+# - 顔文字・ネットスラング: ｷﾀ━━━━(ﾟ∀ﾟ)━━━━!! や ｗｗｗ など、表記チェックの対象外にする範囲
+# 話者の行・空行・演出指示だけの行が新しい「まとまり」(ユニット) の始まりになり、
+# 括弧の対応はユニットの中で完結する。再チェックはユニット単位で行えば結果が変わらない。
+
+import re
+from bisect import bisect_right
+from operator import itemgetter
+
+from rule_engine import LineIndex
+
+# 解析結果の形式が変わったら上げる (校正結果の再利用を止めるため)
+PARSER_VERSION = 2
+
+# 話し言葉の速さ (1分あたりの文字数) とターンごとの間 (秒)。読み上げソフトの設定に合わせて調整する
+SPOKEN_CHARS_PER_MINUTE = 380
+TURN_PAUSE_SECONDS = 0.4
+# ネットスラングは読み上げると短くなる (例: ｗｗｗ → 「わら」) ため、1つあたりこの文字数で数える
+SLANG_SPOKEN_CHARS = 2
+
+# 行頭の字句: 話者 (「名前:」) か、空行・演出指示だけの行 (いずれも新しいユニットの始まり)
+# 名前には句読点を含めず、コロンの直後が数字のもの (「時刻は10:30」「3:1」などの時刻・比) は話者にしない
+_LINE_START = (r'[ \t]*(?:(?P<name>[^\s:：「」『』【】()（）、。,!?！？]{1,10})[ \t]*[:：](?!//|[0-9０-９])'
+               r'|(?P<unit>(?:【[^】\n]*】[ \t]*)*)(?=\n|\Z))')
+_FIRST_LINE = re.compile(_LINE_START)
+_NEXT_LINE = re.compile(r'\n' + _LINE_START)
+_DIRECTIVE = re.compile(r'【(?P<kind>[^:：】\n]{1,10})[:：][ \t]*(?P<body>[^】\n]*)】')
+_BRACKET = re.compile(r'[「」『』（）【】]')
+# 同じ行の中で、間にほかの括弧を挟まずに閉じている括弧の組。対応付けの結果が決まっているため、まとめて読み飛ばす
+_BRACKET_OR_PAIR = re.compile(r'「[^「」『』（）【】\n]*」|『[^「」『』（）【】\n]*』|（[^「」『』（）【】\n]*）|【[^「」『』（）【】\n]*】'
+                              r'|[「」『』（）【】]')
+# 顔文字: 括弧の中に顔のパーツを含むもの。前後の腕や ━━━━ 、続く !! は見つけたあとで広げる
+_KAOMOJI_FACE = re.compile(r'[(（](?=[^()（）\n]{0,12}?[´｀`・ωДд∀ﾟ゜＾^≧≦;；ρ∩＿_])[^()（）「」\n]{1,12}[)）]')
+_KAOMOJI_TAIL = re.compile(r'[ﾉノ/／⊃]*━*[!！]*')
+_KAOMOJI_ARMS = 'ヽ＼\\mｍ⊂'
+# ネットスラング。先頭の1文字を文字クラスにして、re の前方探索 (先頭文字での読み飛ばし) が効くようにしている
+_SLANG = re.compile(
+    r'[wｗkgo激禿乙草](?:(?<=[wｗ])[wｗ]+'
+    r'|(?<![A-Za-z]k)(?<=k)(?:wsk|tkr|skst)(?![A-Za-z])|(?<![A-Za-z]w)(?<=w)ktk(?![A-Za-z])'
+    r'|(?<![A-Za-z]g)(?<=g)kbr(?![A-Za-z])|(?<![A-Za-z]o)(?<=o)rz(?![A-Za-z])'
+    r'|(?<=激)しく同意|(?<=禿)同|(?<=[乙草])(?=$|[\s。、!！?？wｗ」』]))',
+    re.MULTILINE)
+
+BRACKET_PAIRS = {'「': '」', '『': '』', '（': '）', '【': '】'}
+_OPENERS = {close: open_ for open_, close in BRACKET_PAIRS.items()}
+
+
+def speaker_kind(name):
+    if name in ('N', 'ナレーション'):
+        return 'narration'
+    if name == 'イッチ':
+        return 'ichi'
+    if name.startswith('名無し'):
+        return 'nanashi'
+    return 'other'
+
+
+def is_unit_start(line):
+    # 話者の行・空行・演出指示だけの行は、新しいユニットの始まり
+    return _FIRST_LINE.match(line) is not None
+
+
+class ScriptDocument:
+    # 位置はすべて text 内のオフセット。
+    # turns: (行インデックス, 話者, 種類, 本文の開始位置)
+    # directives: (開始, 終了, 種類, 内容)
+    # spans: 顔文字・スラングの (開始, 終了, 種類)。開始位置順 (最初に使うときに求める)
+    # brackets: 対応の取れた括弧の (開き位置, 閉じ位置)
+    # bracket_errors: (位置, 括弧, 問題) 問題は 'unclosed' / 'unexpected'
+    __slots__ = ('text', 'line_starts', 'turns', 'directives', '_spans', 'brackets', 'bracket_errors', '_span_starts')
+
+    def __init__(self, text, line_starts):
+        self.text = text
+        self.line_starts = line_starts
+        self.turns = []
+        self.directives = []
+        self._spans = None
+        self.brackets = []
+        self.bracket_errors = []
+        self._span_starts = None
+
+    @property
+    def spans(self):
+        if self._spans is None:
+            self._spans = _find_spans(self.text)
+        return self._spans
+
+    def locate(self, offset):
+        # (行インデックス, 行内位置) を返す
+        line_idx = bisect_right(self.line_starts, offset) - 1
+        return line_idx, offset - self.line_starts[line_idx]
+
+    def in_span(self, offset):
+        # offset が顔文字・スラングの中にあるか
+        span_starts = self._span_starts
+        if span_starts is None:
+            span_starts = self._span_starts = [span[0] for span in self.spans]
+        idx = bisect_right(span_starts, offset) - 1
+        return idx >= 0 and offset < self._spans[idx][1]
+
+
+def _line_starts_tokens(text):
+    first = _FIRST_LINE.match(text)
+    if first is not None:
+        yield 0, first
+    for match in _NEXT_LINE.finditer(text):
+        yield match.start() + 1, match
+
+
+def _kaomoji_spans(text):
+    for match in _KAOMOJI_FACE.finditer(text):
+        start = match.start()
+        if start and text[start - 1] in _KAOMOJI_ARMS:
+            start -= 1
+        if start and text[start - 1] == '━':
+            while start and text[start - 1] == '━':
+                start -= 1
+            while start and 'ｦ' <= text[start - 1] <= 'ﾟ':
+                start -= 1
+        yield start, _KAOMOJI_TAIL.match(text, match.end()).end(), 'kaomoji'
+
+
+def _unit_start_between(text, starts, start, end):
+    # start より後、end までに始まる行に、ユニットの始まりがあるか (改行をまたがなければ調べない)
+    if text.find('\n', start, end) == -1:
+        return False
+    match_line = _FIRST_LINE.match
+    for line_idx in range(bisect_right(starts, start), bisect_right(starts, end)):
+        if match_line(text, starts[line_idx]) is not None:
+            return True
+    return False
+
+
+def _find_spans(text):
+    # 顔文字・スラング (重なった範囲はまとめる)
+    spans = sorted(list(_kaomoji_spans(text)) + [(m.start(), m.end(), 'slang') for m in _SLANG.finditer(text)])
+    merged = []
+    for span in spans:
+        if merged and span[0] < merged[-1][1]:
+            if span[1] > merged[-1][1]:
+                merged[-1] = (merged[-1][0], span[1], merged[-1][2])
+        else:
+            merged.append(span)
+    return merged
+
+
+def parse_brackets(text, line_starts=None):
+    # 括弧の対応だけを求める (基本チェック用)。話者ターンと演出指示は空のまま、顔文字・スラングは最初に使うときに求める。
+    # ユニットの境目は、開いたままの括弧があるときだけ、前の括弧からの行を調べる
+    document = ScriptDocument(text, line_starts if line_starts is not None else LineIndex(text).starts)
+    starts = document.line_starts
+    errors = document.bracket_errors
+    brackets = document.brackets
+    stack = []
+    previous = 0
+    for match in _BRACKET_OR_PAIR.finditer(text):
+        offset = match.start()
+        if match.end() - offset > 1:
+            brackets.append((offset, match.end() - 1))
+            continue
+        # ユニットが変わったら、開いたままの括弧は閉じ忘れ
+        if stack and _unit_start_between(text, starts, previous, offset):
+            errors.extend((position, char, 'unclosed') for position, char in stack)
+            stack.clear()
+        previous = offset
+        char = match.group()
+        if char in BRACKET_PAIRS:
+            stack.append((offset, char))
+            continue
+        opener = _OPENERS[char]
+        # 対応する開き括弧までさかのぼり、その間で閉じられていない括弧は閉じ忘れとする
+        depth = len(stack) - 1
+        while depth >= 0 and stack[depth][1] != opener:
+            depth -= 1
+        if depth < 0:
+            errors.append((offset, char, 'unexpected'))
+            continue
+        if depth + 1 < len(stack):
+            errors.extend((position, unclosed, 'unclosed') for position, unclosed in stack[depth + 1:])
+        brackets.append((stack[depth][0], offset))
+        del stack[depth:]
+    errors.extend((position, char, 'unclosed') for position, char in stack)
+    errors.sort()
+    # 閉じ括弧の位置順に並べる
+    brackets.sort(key=itemgetter(1))
+    return document
+
+
+def parse_script(text, line_starts=None):
+    # 字句の種類ごとに、先頭文字で読み飛ばせる正規表現でテキストを1回ずつ走査し、1つの構造にまとめる。
+    # 走査の回数は字句の種類の数で決まっているため、全体でテキスト長に比例する時間で終わる
+    document = parse_brackets(text, line_starts)
+    starts = document.line_starts
+
+    # 話者ターン
+    turns = document.turns
+    for line_start, match in _line_starts_tokens(text):
+        name = match.group('name')
+        if name is not None:
+            turns.append((bisect_right(starts, line_start) - 1, name, speaker_kind(name), match.end()))
+
+    document.directives = [(m.start(), m.end(), m.group('kind'), m.group('body')) for m in _DIRECTIVE.finditer(text)]
+    return document
+
+
+def bracket_results(document, first_line=1):
+    # 括弧の対応の誤りを、校正結果の形式で返す
+    results = []
+    for offset, char, problem in document.bracket_errors:
+        line_idx, position = document.locate(offset)
+        if problem == 'unclosed' and char in '「『':
+            rule_type, message = 'セリフ閉じ忘れ', f"セリフの閉じ括弧「{BRACKET_PAIRS[char]}」が見つかりません"
+        elif problem == 'unclosed':
+            rule_type, message = '括弧の閉じ忘れ', f"閉じ括弧「{BRACKET_PAIRS[char]}」が見つかりません"
+        else:
+            rule_type, message = '括弧の対応', f"対応する開き括弧「{_OPENERS[char]}」がありません"
+        results.append({'type': rule_type, 'line': line_idx + first_line, 'position': position,
+                        'text': char, 'message': message, 'severity': 'error'})
+    return results
+
+
+def _merge_ranges(ranges):
+    # (開始, 終了) の範囲のうち、重なる・接するものをまとめて開始位置順に返す
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def estimate_duration(document):
+    # 読み上げにかかる時間の目安。話者名・演出指示・顔文字・空白は読まず、スラングは短く数える。
+    # 読まない範囲は重なることがある (演出指示の中の顔文字、話者名のあとの空白など) ため、
+    # 範囲をまとめて取り除いた残りの文字から空白を数える
+    text = document.text
+    unread = _merge_ranges([(document.line_starts[line_idx], body_start) for line_idx, _, _, body_start in document.turns]
+                           + [(start, end) for start, end, _, _ in document.directives])
+    # 話者名や演出指示の中のスラングは読まないため、短く数える対象にもしない
+    unread_starts = [start for start, _ in unread]
+    slang_count = 0
+    for start, _, kind in document.spans:
+        if kind == 'slang':
+            idx = bisect_right(unread_starts, start) - 1
+            if idx < 0 or start >= unread[idx][1]:
+                slang_count += 1
+    pieces = []
+    cursor = 0
+    for start, end in _merge_ranges(unread + [(start, end) for start, end, _ in document.spans]):
+        pieces.append(text[cursor:start])
+        cursor = end
+    pieces.append(text[cursor:])
+    spoken = ''.join(pieces)
+    spoken_chars = (len(spoken) - spoken.count('\n') - spoken.count(' ') - spoken.count('　')
+                    + slang_count * SLANG_SPOKEN_CHARS)
+    seconds = spoken_chars * 60.0 / SPOKEN_CHARS_PER_MINUTE + len(document.turns) * TURN_PAUSE_SECONDS
+    return {'seconds': seconds, 'spoken_chars': spoken_chars, 'turns': len(document.turns),
+            'directives': len(document.directives)}
+
+
+def check_length(document, length_minutes, tolerance=0.2):
+    # 推定した尺が目標 (分) から tolerance の割合以上ずれていれば、その旨の指摘を返す
+    estimate = estimate_duration(document)
+    minutes = estimate['seconds'] / 60.0
+    if length_minutes and abs(minutes - length_minutes) > length_minutes * tolerance:
+        direction = '長すぎます' if minutes > length_minutes else '短すぎます'
+        return estimate, {'type': '尺', 'line': 0, 'position': 0, 'text': f"約{minutes:.1f}分",
+                          'message': f"推定の尺が約{minutes:.1f}分で、目標の{length_minutes}分に対して{direction}",
+                          'severity': 'suggestion'}
+    return estimate, None
@@ -0,0 +1,43 @@
+# AIチェック用のチャンク分割の確認
+
+import random
+
+from proofreading_core import split_into_chunks
+
+CHUNK_LINES = 150
+OVERLAP = 10
+
+
+def prompt_keys(chunks):
+    # AIへの問い合わせ内容を決める部分 (行と、その中の担当範囲)
+    return {(tuple(chunk['lines']), chunk['own_start'] - chunk['start'], chunk['own_end'] - chunk['start'])
+            for chunk in chunks}
+
+
+def repetitive_script(num_lines):
+    # 同じ行が何度も現れる台本 (内容から決まる区切りが少ない)
+    rng = random.Random(0)
+    vocabulary = [f"{speaker}: {phrase}" for speaker in ('N', 'イッチ') for phrase in ('続きはよ', '詳しく聞かせて', 'それな', '草', 'はよ')]
+    return [rng.choice(vocabulary) for _ in range(num_lines)]
+
+
+def test_chunks_cover_every_line_once():
+    lines = repetitive_script(1500)
+    chunks = split_into_chunks(lines, CHUNK_LINES, OVERLAP)
+    assert [chunk['own_start'] for chunk in chunks[1:]] == [chunk['own_end'] for chunk in chunks[:-1]]
+    assert chunks[0]['own_start'] == 0 and chunks[-1]['own_end'] == len(lines)
+    assert all(chunk['own_end'] - chunk['own_start'] <= CHUNK_LINES * 3 // 2 for chunk in chunks)
+
+
+def test_one_insertion_invalidates_at_most_two_chunks():
+    lines = repetitive_script(1500)
+    chunks = split_into_chunks(lines, CHUNK_LINES, OVERLAP)
+    before = prompt_keys(chunks)
+    edges = [chunk['own_start'] for chunk in chunks]
+    for position in range(25, len(lines), 50):
+        # 区切りの近くに入れた行は、隣のチャンクの文脈にも入るため除く
+        if any(abs(position - edge) <= OVERLAP for edge in edges):
+            continue
+        inserted = lines[:position] + ['名無しA: 追加した行'] + lines[position:]
+        after = prompt_keys(split_into_chunks(inserted, CHUNK_LINES, OVERLAP))
+        assert len(after - before) <= 2, position
@@ -0,0 +1,35 @@
+# APIキーごとの AiAssistant が、あとから別のキーが設定されても自分のキーで送信することの確認
+
+import warnings
+
+import pytest
+
+from ai_scheduler import RequestScheduler
+
+with warnings.catch_warnings():
+    warnings.simplefilter('ignore')
+    pytest.importorskip('google.generativeai')
+
+from proofreading_core import AiAssistant
+
+
+def api_key_of(assistant):
+    # モデルに固定したクライアントが送信に使う認証情報 (google-generativeai 0.8.x の内部属性)
+    return assistant.model._client._transport._credentials.token
+
+
+def test_each_scheduler_keeps_its_own_key():
+    assistants = {key: AiAssistant(key, scheduler=RequestScheduler(requests_per_minute=None, tokens_per_minute=None))
+                  for key in ('key-A', 'key-B', 'key-C')}
+    # 最後に作ったキー以外のアシスタントも、それぞれのキーのままになっている
+    for key, assistant in assistants.items():
+        assert api_key_of(assistant) == key
+    assert len({id(assistant.scheduler) for assistant in assistants.values()}) == 3
+
+
+def test_key_is_bound_before_first_request():
+    first = AiAssistant('key-A')
+    AiAssistant('key-B')
+    # generate_content は設定済みのクライアントを使い、既定のクライアントを取り直さない
+    assert first.model._client is not None
+    assert api_key_of(first) == 'key-A'
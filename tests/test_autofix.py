@@ -0,0 +1,76 @@
+# 一括修正で作る unified diff が patch / git apply でそのまま当たり、修正後のテキストと一致することの確認
+
+import random
+import shutil
+import subprocess
+
+import pytest
+
+from autofix import apply_edits, apply_fixes, resolve_overlaps, unified_diff
+from proofreading_core import ScriptProofreadingTool
+
+FILENAME = '台本.txt'
+
+
+def apply_with(command, tmp_path, text, diff):
+    (tmp_path / FILENAME).write_bytes(text.encode('utf-8'))
+    (tmp_path / 'fix.diff').write_bytes(diff.encode('utf-8'))
+    subprocess.run(command + ['fix.diff'], cwd=tmp_path, check=True, capture_output=True)
+    return (tmp_path / FILENAME).read_bytes().decode('utf-8')
+
+
+COMMANDS = {
+    'patch': ['patch', '-p1', '--quiet', '--force', '-i'],
+    'git': ['git', 'apply', '--unsafe-paths', '-p1'],
+}
+
+
+@pytest.fixture(params=list(COMMANDS))
+def apply_diff(request, tmp_path):
+    command = COMMANDS[request.param]
+    if shutil.which(command[0]) is None:
+        pytest.skip(f"{command[0]} がありません")
+    counter = iter(range(1000000))
+
+    def apply(text, diff):
+        directory = tmp_path / str(next(counter))
+        directory.mkdir()
+        return apply_with(command, directory, text, diff)
+    return apply
+
+
+@pytest.mark.parametrize('text', [
+    'N: 出来る\n',
+    'N: 出来る',
+    'a\nb\nN: 出来る\n\n',
+    'N: 出来る\nx',
+    'N: 出来る\n' + 'x\n' * 10 + 'N: 見れる',
+])
+def test_basic_fix_diff_applies(apply_diff, text):
+    result = apply_fixes(text, ScriptProofreadingTool().perform_basic_check(text), filename=FILENAME)
+    assert result['applied']
+    assert apply_diff(text, result['diff']) == result['text']
+
+
+def random_edits(rng, text):
+    edits = []
+    for _ in range(rng.randrange(1, 6)):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.randrange(0, 4))
+        replacement = ''.join(rng.choice('あい\nx') for _ in range(rng.randrange(0, 3)))
+        if text[start:end] != replacement:
+            edits.append((start, end, replacement, {'type': 'test'}))
+    return resolve_overlaps(edits, len(text))[0]
+
+
+def test_random_edit_diffs_apply(apply_diff):
+    rng = random.Random(0)
+    for _ in range(30):
+        text = ''.join(rng.choice(['あ', 'い', 'x', '\n', '\n\n']) for _ in range(rng.randrange(1, 40)))
+        edits = random_edits(rng, text)
+        if not edits:
+            continue
+        fixed = apply_edits(text, edits)
+        diff = unified_diff(text, edits, FILENAME)
+        assert diff
+        assert apply_diff(text, diff) == fixed
@@ -0,0 +1,33 @@
+# 一括生成のジョブファイルの読み込みの確認
+
+import pytest
+
+from batch_pipeline import parse_jobs
+
+
+def test_ids_are_sanitized_and_defaulted():
+    jobs = parse_jobs('id,genre,theme,length_minutes\na/b,恋愛,告白,5\n,仕事,上司,\n', 'csv')
+    assert [job['id'] for job in jobs] == ['a_b', '00002']
+
+
+@pytest.mark.parametrize('text, message', [
+    ('id,genre,theme\nx,a,b\nx,c,d\n', '2 行目: ID「x」は1 行目と重複しています'),
+    ('id,genre,theme\na/b,a,b\na_b,c,d\n', '2 行目: ID「a_b」は1 行目の「a/b」と同じ出力先「a_b」になります'),
+    # id 列のない行の既定の ID (行番号) とも重ならないようにする
+    ('id,genre,theme\n,a,b\n00001,c,d\n', '2 行目: ID「00001」は1 行目と重複しています'),
+    ('id,genre,theme\n..,a,b\n', '1 行目: ID「..」は出力先のディレクトリ名に使えません'),
+])
+def test_conflicting_ids_are_rejected(text, message):
+    with pytest.raises(ValueError, match=message):
+        parse_jobs(text, 'csv')
+
+
+def test_jsonl_duplicates_are_rejected():
+    with pytest.raises(ValueError, match='重複'):
+        parse_jobs('{"id": 1, "genre": "a"}\n{"id": "1", "genre": "b"}\n', 'jsonl')
+
+
+@pytest.mark.parametrize('line', ['[1, 2]', '"x"', '3', 'null'])
+def test_jsonl_rows_that_are_not_objects_are_rejected(line):
+    with pytest.raises(ValueError, match='2 行目: JSON のオブジェクト'):
+        parse_jobs('{"genre": "a"}\n' + line + '\n', 'jsonl')
@@ -0,0 +1,44 @@
+# AI応答キャッシュの2層 (メモリ・ディスク) の LRU の確認
+
+import sqlite3
+import time
+
+from response_cache import ResponseCache
+
+
+def accessed_at(path, cache, prompt):
+    with sqlite3.connect(path) as conn:
+        return conn.execute('SELECT accessed_at FROM responses WHERE key = ?',
+                            (cache.make_key('model', prompt),)).fetchone()[0]
+
+
+def test_memory_hits_keep_entries_from_disk_eviction(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(path, max_entries=3)
+    for prompt in ('a', 'b', 'c'):
+        cache.set('model', prompt, prompt.upper())
+        time.sleep(0.01)
+    # a はメモリ層から返るが、最後に使った時刻はディスク層にも反映される
+    assert cache.get('model', 'a') == 'A'
+    cache.set('model', 'd', 'D')
+
+    reopened = ResponseCache(path, max_entries=3)
+    assert reopened.get('model', 'a') == 'A'
+    assert reopened.get('model', 'b') is None
+
+
+def test_memory_hits_are_written_in_batches(tmp_path, monkeypatch):
+    import response_cache
+
+    monkeypatch.setattr(response_cache, 'ACCESS_FLUSH_ENTRIES', 2)
+    path = str(tmp_path / 'cache.sqlite3')
+    cache = ResponseCache(path)
+    cache.set('model', 'a', 'A')
+    cache.set('model', 'b', 'B')
+    written = accessed_at(path, cache, 'a')
+    time.sleep(0.01)
+    cache.get('model', 'a')
+    # 1件目はまだ書き込まない
+    assert accessed_at(path, cache, 'a') == written
+    cache.get('model', 'b')
+    assert accessed_at(path, cache, 'a') > written
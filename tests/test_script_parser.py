@@ -0,0 +1,66 @@
+# 台本の字句解析 (話者ターン・ユニット・尺の推定) の確認
+
+import pytest
+
+from proofreading_core import ScriptProofreadingTool
+from script_parser import SLANG_SPOKEN_CHARS, estimate_duration, is_unit_start, parse_brackets, parse_script
+
+
+@pytest.mark.parametrize('line', ['N: 始まり', 'イッチ：「', '名無しA:', '名無し1: 10時に起きた', '【画像: 休憩室】', ''])
+def test_unit_starts(line):
+    assert is_unit_start(line)
+
+
+@pytest.mark.parametrize('line', ['時刻は10:30になった', '比率は3：1だった', 'ええと、結論: 無理', 'http://example.com'])
+def test_colon_inside_sentence_is_not_a_speaker(line):
+    assert not is_unit_start(line)
+
+
+def test_time_inside_multiline_quote_keeps_brackets_paired():
+    text = 'イッチ: 「朝から呼び出されて\n時刻は10:30になった」\nN: 続く'
+    assert parse_script(text).bracket_errors == []
+    assert len(parse_script(text).turns) == 2
+    assert ScriptProofreadingTool().perform_basic_check(text) == []
+
+
+@pytest.mark.parametrize('text, errors', [
+    ('イッチ: 「あ『い』う」\nN: 「続きの行で\n閉じる」', []),
+    ('イッチ: 「閉じ忘れ\nN: 「あ」」', [(5, '「', 'unclosed'), (17, '」', 'unexpected')]),
+    ('N: （あ「い）\n\n」', [(5, '「', 'unclosed'), (10, '」', 'unexpected')]),
+])
+def test_brackets_are_paired_within_units(text, errors):
+    document = parse_brackets(text)
+    assert document.bracket_errors == errors
+    assert document.brackets == parse_script(text).brackets
+
+
+def spoken_chars_by_mask(document):
+    # 読まない文字に1文字ずつ印を付けて数える (estimate_duration と同じ結果になるはずの素朴な実装)
+    text = document.text
+    unread = bytearray(len(text))
+    for line_idx, _, _, body_start in document.turns:
+        unread[document.line_starts[line_idx]:body_start] = b'\x01' * (body_start - document.line_starts[line_idx])
+    for start, end, _, _ in document.directives:
+        unread[start:end] = b'\x01' * (end - start)
+    slang = sum(1 for start, _, kind in document.spans if kind == 'slang' and not unread[start])
+    for start, end, _ in document.spans:
+        unread[start:end] = b'\x01' * (end - start)
+    spoken = sum(1 for offset, char in enumerate(text) if not unread[offset] and char not in ' 　\n')
+    return spoken + slang * SLANG_SPOKEN_CHARS
+
+
+@pytest.mark.parametrize('text', [
+    'N: これは テスト',
+    '【テロップ: 衝撃 (´・ω・｀) の事実 ｗｗｗ】',
+    'イッチ: ｷﾀ━━━━(ﾟ∀ﾟ)━━━━!! kwsk\n\n名無しA:　草',
+    'ｗｗｗ: 話者名がスラング\n  N : 前に空白',
+])
+def test_duration_counts_each_character_once(text):
+    document = parse_script(text)
+    assert estimate_duration(document)['spoken_chars'] == spoken_chars_by_mask(document)
+
+
+def test_duration_matches_mask_on_mixed_script():
+    lines = ['N: これは テスト', '【画像: 休憩室 (´・ω・｀)】', 'イッチ: 「kwsk  ｗｗｗ」', '', '名無しB: 草 乙', '時刻は10:30 になった']
+    document = parse_script('\n'.join(lines * 50))
+    assert estimate_duration(document)['spoken_chars'] == spoken_chars_by_mask(document)
@@ -0,0 +1,74 @@
+# 台本のストリーミング生成と、生成中の行単位の基本チェックの確認
+
+from types import SimpleNamespace
+
+import proofreading_core
+from proofreading_core import AiAssistant, SectionStitcher
+
+
+class FailingModel:
+    # 途中までチャンクを返してから接続が切れるモデル
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, prompt, stream=False):
+        for chunk in self.chunks:
+            yield SimpleNamespace(parts=[chunk], text=chunk)
+        raise ConnectionError('stream reset')
+
+
+def make_assistant(monkeypatch, chunks, errors):
+    genai = SimpleNamespace(configure=lambda **kwargs: None, GenerativeModel=lambda name: FailingModel(chunks))
+    monkeypatch.setattr(proofreading_core, '_import_genai',
+                        lambda: (genai, SimpleNamespace(get_default_generative_client=lambda: None)))
+    monkeypatch.setattr(proofreading_core, 'GENAI_AVAILABLE', True)
+    return AiAssistant('test-key', on_error=errors.append)
+
+
+def test_stream_failure_is_reported_to_caller(monkeypatch):
+    errors = []
+    stream = make_assistant(monkeypatch, ['N: 途中まで\n', 'イッチ: '], errors).create_script('プロット', stream=True)
+    assert ''.join(stream) == 'N: 途中まで\nイッチ: '
+    assert isinstance(stream.error, ConnectionError)
+    assert len(errors) == 1
+
+
+def test_completed_stream_has_no_error():
+    stream = proofreading_core.ReportedStream(iter(['N: 完成\n']), on_error=None)
+    assert list(stream) == ['N: 完成\n']
+    assert stream.error is None
+
+
+def test_chunked_feed_matches_whole_text():
+    tool = proofreading_core.ScriptProofreadingTool()
+    text = 'N: これは出来る。。\n' + 'イッチ: 「' + 'あ' * 5000 + '出来る\n続き」\n\n名無しA: 見れる'
+    expected = tool.perform_basic_check(text)
+    for size in (1, 3, 7, 1000):
+        checker = tool.streaming_checker()
+        for start in range(0, len(text), size):
+            checker.feed(text[start:start + size])
+        checker.finish()
+        assert checker.results() == expected
+        assert checker.lines == text.split('\n')
+
+
+def stitch(sections):
+    stitcher = SectionStitcher()
+    out = []
+    for section in sections:
+        stitcher.start_section()
+        out.append(stitcher.feed(section))
+        out.append(stitcher.end_section())
+    return ''.join(out)
+
+
+def test_stitcher_drops_lines_repeated_at_part_boundary():
+    first = 'N: 今日は会社でちょっとした事件があった\nイッチ: 上司が急に呼び出してきたんや\n'
+    second = 'イッチ: 上司が急に呼び出してきたんや\n名無しA: kwsk\n'
+    assert stitch([first, second]) == first + '名無しA: kwsk\n'
+
+
+def test_stitcher_keeps_short_reaction_repeated_at_part_boundary():
+    first = 'イッチ: 上司が急に呼び出してきたんや\n名無しA: 草\n'
+    second = '名無しA: 草\nイッチ: しかも休憩室でな\n'
+    assert stitch([first, second]) == first + second
@@ -0,0 +1,43 @@
+# 壊れた辞書ファイル・形式の合わない項目があっても、残りの辞書で校正を続けられることの確認
+
+import json
+
+from user_dictionary import DictionaryRegistry
+
+
+def write(path, content):
+    path.write_text(content, encoding='utf-8')
+    return path
+
+
+def test_broken_files_and_entries_are_skipped(tmp_path):
+    write(tmp_path / 'broken.json', '[{"wrong": "出来る", ')
+    write(tmp_path / 'object.json', json.dumps({'wrong': '出来る'}))
+    write(tmp_path / 'mixed.json', json.dumps([{'wrong': '下さい', 'correct': 'ください'}, {'correct': 'できる'}, 3,
+                                               {'wrong': '頂く', 'correct': ['いただく']}]))
+    write(tmp_path / 'notation.tsv', '事が出来る\tことができる\n見れる\n')
+    registry = DictionaryRegistry(str(tmp_path), cache_dir=str(tmp_path / 'cache'))
+
+    dictionaries = {dictionary.name: dictionary for dictionary in registry.refresh()}
+    assert sorted(dictionaries) == ['mixed.json', 'notation.tsv']
+    assert dictionaries['mixed.json'].words == ['下さい']
+    assert dictionaries['notation.tsv'].words == ['事が出来る']
+
+    problems = registry.problems()
+    assert len(problems) == 6
+    assert any(problem.startswith('broken.json を読み込めませんでした') for problem in problems)
+    assert any(problem.startswith('object.json を読み込めませんでした') for problem in problems)
+    assert sum(problem.startswith('mixed.json ') for problem in problems) == 3
+    assert any(problem.startswith('notation.tsv 2 行目') for problem in problems)
+
+
+def test_fixed_file_is_loaded_again(tmp_path):
+    path = write(tmp_path / 'notation.json', '[')
+    registry = DictionaryRegistry(str(tmp_path))
+    assert registry.refresh() == []
+    # 同じ内容のままなら読み直さず、警告も残る
+    assert registry.refresh() == [] and len(registry.problems()) == 1
+
+    write(path, json.dumps([{'wrong': '出来る', 'correct': 'できる'}, {'wrong': '見れる', 'correct': '見られる'}]))
+    assert [len(dictionary) for dictionary in registry.refresh()] == [2]
+    assert registry.problems() == []
@@ -0,0 +1,219 @@
+# tracing.py (処理時間・トークン数の計測)
+#
+# 段階ごと (プロット生成・台本生成・基本チェック・AIチェック・結果の描画など) と
+# ルールごとの処理時間を「スパン」として記録し、名前ごとに集計する。
+# - Gemini の呼び出しは、応答の usage_metadata から入出力のトークン数も記録する
+# - キャッシュの参照結果 (hit / miss) は名前ごとのカウンターで数え、ヒット率を出す
+# - 記録は直近 MAX_EVENTS 件だけメモリに保持し、JSONL で書き出せる
+# - プロファイリングを有効にすると、各スレッドの最も外側のスパンを cProfile で計測して累積する
+# プロセス全体で1つの tracer を共有する (Streamlit では全セッション分の合計になる)。
+
+import io
+import json
+import threading
+import time
+from collections import deque
+
+MAX_EVENTS = 5000
+# 名前ごとに保持する処理時間の標本数 (パーセンタイルの計算に使う)
+MAX_SAMPLES = 1000
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class _Span:
+    # tracer.span() が返すコンテキストマネージャー。with の as で受け取る attrs に結果の情報を書き足せる
+    __slots__ = ('tracer', 'name', 'attrs', 'parent', 'profile', 'started')
+
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        tracer = self.tracer
+        stack = tracer._stack()
+        self.parent = stack[-1] if stack else None
+        self.profile = tracer._start_profile() if self.parent is None and tracer._profiling else None
+        stack.append(self.name)
+        self.started = time.perf_counter()
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.started
+        tracer = self.tracer
+        tracer._local.stack.pop()
+        if self.profile is not None:
+            tracer._stop_profile(self.profile)
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        tracer._record(self.name, self.started, duration, self.parent, self.attrs)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ('attrs',)
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+
+    def __enter__(self):
+        return self.attrs
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+class Tracer:
+    def __init__(self, max_events=MAX_EVENTS):
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._events = deque(maxlen=max_events)
+        self._spans = {}
+        self._counters = {}
+        self._profiling = False
+        self._profile_stats = None
+        # perf_counter の値を時刻に直すための基準
+        self._clock_offset = time.time() - time.perf_counter()
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def span(self, name, **attrs):
+        # with tracer.span('perform_basic_check') as attrs: ... の形で使う
+        if not self.enabled:
+            return _NullSpan(attrs)
+        return _Span(self, name, attrs)
+
+    def record(self, name, duration, **attrs):
+        # スパンで囲めない処理 (ジェネレーターなど) の時間を、終わったあとにまとめて記録する
+        if self.enabled:
+            self._record(name, time.perf_counter() - duration, duration, None, attrs)
+
+    def _record(self, name, started, duration, parent, attrs):
+        # 記録はタプルのまま持ち、辞書への変換は書き出すときまで遅らせる (計測自体の負荷を抑えるため)
+        with self._lock:
+            self._events.append((name, started, duration, parent, threading.current_thread().name, attrs))
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = {'count': 0, 'total': 0.0, 'max': 0.0, 'errors': 0,
+                                             'samples': deque(maxlen=MAX_SAMPLES), 'tokens': {}}
+            stats['count'] += 1
+            stats['total'] += duration
+            if duration > stats['max']:
+                stats['max'] = duration
+            stats['samples'].append(duration)
+            if attrs:
+                if 'error' in attrs:
+                    stats['errors'] += 1
+                for key, value in attrs.items():
+                    if key.endswith('_tokens') and isinstance(value, int):
+                        stats['tokens'][key] = stats['tokens'].get(key, 0) + value
+
+    def count(self, name, outcome, amount=1):
+        # キャッシュの hit / miss などを数える
+        if not self.enabled:
+            return
+        with self._lock:
+            counter = self._counters.setdefault(name, {})
+            counter[outcome] = counter.get(outcome, 0) + amount
+
+    def span_summary(self):
+        # 名前ごとの件数・合計・平均・p50・p99・最大 (ミリ秒) と、トークン数の合計
+        with self._lock:
+            items = [(name, dict(stats, samples=sorted(stats['samples']), tokens=dict(stats['tokens'])))
+                     for name, stats in self._spans.items()]
+        summary = []
+        for name, stats in sorted(items, key=lambda item: -item[1]['total']):
+            samples = stats['samples']
+            summary.append({
+                'name': name, 'count': stats['count'], 'errors': stats['errors'],
+                'total_ms': round(stats['total'] * 1000, 1),
+                'avg_ms': round(stats['total'] * 1000 / stats['count'], 2),
+                'p50_ms': round(_percentile(samples, 0.5) * 1000, 2),
+                'p99_ms': round(_percentile(samples, 0.99) * 1000, 2),
+                'max_ms': round(stats['max'] * 1000, 2),
+                **stats['tokens'],
+            })
+        return summary
+
+    def counter_summary(self):
+        # 名前ごとのカウンターと、hit / miss があればヒット率
+        with self._lock:
+            counters = {name: dict(counter) for name, counter in self._counters.items()}
+        summary = []
+        for name, counter in sorted(counters.items()):
+            row = {'name': name, **counter}
+            lookups = counter.get('hit', 0) + counter.get('miss', 0)
+            if lookups:
+                row['hit_rate'] = round(counter.get('hit', 0) / lookups, 3)
+            summary.append(row)
+        return summary
+
+    def export_jsonl(self):
+        with self._lock:
+            events = list(self._events)
+        lines = []
+        for name, started, duration, parent, thread, attrs in events:
+            event = {'name': name, 'start': round(self._clock_offset + started, 6), 'duration_ms': round(duration * 1000, 3),
+                     'parent': parent, 'thread': thread, **attrs}
+            lines.append(json.dumps(event, ensure_ascii=False, default=str) + '\n')
+        return ''.join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._events.clear()
+            self._spans.clear()
+            self._counters.clear()
+            self._profile_stats = None
+
+    # --- プロファイリング ---
+    @property
+    def profiling(self):
+        return self._profiling
+
+    def set_profiling(self, enabled):
+        self._profiling = bool(enabled)
+
+    def _start_profile(self):
+        # cProfile / pstats は読み込みに時間がかかるため、使うときまで import しない
+        import cProfile
+
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 別のプロファイラーが動いている場合は計測しない
+            return None
+        return profile
+
+    def _stop_profile(self, profile):
+        import pstats
+
+        profile.disable()
+        with self._lock:
+            if self._profile_stats is None:
+                self._profile_stats = pstats.Stats(profile)
+            else:
+                self._profile_stats.add(profile)
+
+    def profile_report(self, limit=30, sort='cumulative'):
+        # 累積したプロファイルの上位 limit 件を文字列で返す (まだなければ空文字)
+        with self._lock:
+            if self._profile_stats is None:
+                return ''
+            out = io.StringIO()
+            self._profile_stats.stream = out
+            self._profile_stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+tracer = Tracer()
@@ -0,0 +1,309 @@
+# user_dictionary.py (ユーザー辞書による表記統一・NGワードチェック)
+#
+# 数万件規模の「誤 → 正」表記ペアや NGワードを、正規表現ではなく
+# Aho–Corasick オートマトンで照合する。照合時間は辞書の大きさによらずテキスト長に比例する。
+#
+# 辞書ファイルの形式 (ファイル名が *.ng.* のものは NGワード辞書として扱う):
+# - TSV: 表記辞書は「誤<TAB>正[<TAB>メッセージ]」、NGワード辞書は「語[<TAB>メッセージ]」。# で始まる行は無視
+# - JSON: {"wrong": ..., "correct": ..., "message": ...} のリスト (NGワード辞書では correct は不要)
+# コンパイル済みのオートマトンはバイナリキャッシュ (pickle) に保存し、次回からはそれを読み込む。
+# 読めないファイル (JSON の書式の誤りなど) は丸ごと、形式の合わない項目は1件ずつ読み飛ばし、警告として残す。
+
+import hashlib
+import json
+import os
+import pickle
+import re
+import threading
+from bisect import bisect_right
+from collections import deque
+
+DICTIONARY_EXTENSIONS = ('.tsv', '.txt', '.json')
+CACHE_FORMAT_VERSION = 2
+# 辞書ごとに残す、読み飛ばした項目の警告の件数
+MAX_ENTRY_WARNINGS = 20
+
+
+class AhoCorasick:
+    # goto は状態ごとの {文字: 次の状態}、fail は失敗遷移、
+    # output はその状態でちょうど終わるパターン番号 (なければ -1)、
+    # dict_link は失敗遷移をたどって最初に出会う「パターンが終わる状態」(なければ 0)
+    def __init__(self, patterns):
+        self.lengths = [len(p) for p in patterns]
+        goto = [{}]
+        output = [-1]
+        for pattern_id, pattern in enumerate(patterns):
+            state = 0
+            for ch in pattern:
+                next_state = goto[state].get(ch)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][ch] = next_state
+                    goto.append({})
+                    output.append(-1)
+                state = next_state
+            if output[state] == -1:
+                output[state] = pattern_id
+
+        # 幅優先で失敗遷移と出力リンクを求める
+        fail = [0] * len(goto)
+        dict_link = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, next_state in goto[state].items():
+                queue.append(next_state)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                target = goto[f].get(ch, 0)
+                fail[next_state] = target
+                dict_link[next_state] = target if output[target] != -1 else dict_link[target]
+        self.goto = goto
+        self.fail = fail
+        self.output = output
+        self.dict_link = dict_link
+        # 初期状態では、どのパターンの先頭にもならない文字を正規表現 (C 実装) で読み飛ばす
+        first_chars = ''.join(sorted(goto[0]))
+        self.first_char_pattern = re.compile('[' + ''.join(re.escape(ch) for ch in first_chars) + ']') if first_chars else None
+
+    def iter_matches(self, text):
+        # すべての一致を (開始位置, パターン番号) で返す
+        goto, fail, output, dict_link, lengths = self.goto, self.fail, self.output, self.dict_link, self.lengths
+        if self.first_char_pattern is None:
+            return
+        skip_to_candidate = self.first_char_pattern.search
+        text_length = len(text)
+        state = 0
+        end = 0
+        while end < text_length:
+            if state == 0:
+                candidate = skip_to_candidate(text, end)
+                if candidate is None:
+                    return
+                end = candidate.start()
+            ch = text[end]
+            end += 1
+            while True:
+                next_state = goto[state].get(ch)
+                if next_state is not None:
+                    state = next_state
+                    break
+                if state == 0:
+                    break
+                state = fail[state]
+            matched = state if output[state] != -1 else dict_link[state]
+            while matched:
+                pattern_id = output[matched]
+                yield end - lengths[pattern_id], pattern_id
+                matched = dict_link[matched]
+
+    def find_all(self, text):
+        # 重ならない一致を、左から最長一致で選んで (開始位置, パターン番号) のリストで返す
+        lengths = self.lengths
+        candidates = sorted(self.iter_matches(text), key=lambda m: (m[0], -lengths[m[1]]))
+        matches = []
+        covered = 0
+        for start, pattern_id in candidates:
+            if start >= covered:
+                matches.append((start, pattern_id))
+                covered = start + lengths[pattern_id]
+        return matches
+
+
+class DictionaryError(Exception):
+    # 辞書ファイルそのものが読めない (JSON の書式の誤り・文字コードの誤りなど)
+    pass
+
+
+def _json_entry(item):
+    # JSON の1項目を (誤, 正, メッセージ) にする。形式が合わなければ ValueError
+    if isinstance(item, str):
+        item = {'wrong': item}
+    if not isinstance(item, dict):
+        raise ValueError('文字列かオブジェクトではありません')
+    if not isinstance(item.get('wrong'), str):
+        raise ValueError('"wrong" がないか、文字列ではありません')
+    correct, message = item.get('correct') or '', item.get('message') or ''
+    if not isinstance(correct, str) or not isinstance(message, str):
+        raise ValueError('"correct" / "message" が文字列ではありません')
+    return item['wrong'], correct, message
+
+
+def _read_entries(path, is_ng):
+    # (項目のリスト, 読み飛ばした項目の警告のリスト) を返す
+    entries = []
+    warnings = []
+    try:
+        with open(path, encoding='utf-8') as f:
+            if path.endswith('.json'):
+                items = json.load(f)
+                if not isinstance(items, list):
+                    raise DictionaryError('JSON の最上位がリストではありません')
+                for index, item in enumerate(items):
+                    try:
+                        entries.append(_json_entry(item))
+                    except ValueError as e:
+                        warnings.append(f"{index + 1} 件目: {e}")
+            else:
+                for line_number, raw_line in enumerate(f, 1):
+                    line = raw_line.rstrip('\r\n')
+                    if not line.strip() or line.startswith('#'):
+                        continue
+                    columns = line.split('\t')
+                    if is_ng:
+                        entries.append((columns[0], '', columns[1] if len(columns) > 1 else ''))
+                    elif len(columns) >= 2:
+                        entries.append((columns[0], columns[1], columns[2] if len(columns) > 2 else ''))
+                    else:
+                        warnings.append(f"{line_number} 行目: 「正」の列がありません (誤と正はタブで区切ります)")
+    except (OSError, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise DictionaryError(str(e)) from e
+    # 改行を含む語や空の語は照合できないため除く。同じ語が複数あれば先に書かれたものを使う
+    seen = set()
+    unique = []
+    for wrong, correct, message in entries:
+        wrong = wrong.strip()
+        if wrong and '\n' not in wrong and wrong not in seen:
+            seen.add(wrong)
+            unique.append((wrong, correct.strip(), message.strip()))
+    return unique, warnings
+
+
+class UserDictionary:
+    def __init__(self, name, entries, is_ng, version, warnings=()):
+        self.name = name
+        self.is_ng = is_ng
+        self.version = version
+        # 読み飛ばした項目の件数と、先頭 MAX_ENTRY_WARNINGS 件の内容
+        self.skipped_entries = len(warnings)
+        self.warnings = list(warnings[:MAX_ENTRY_WARNINGS])
+        self.words = [entry[0] for entry in entries]
+        self.corrections = [entry[1] for entry in entries]
+        self.messages = [entry[2] for entry in entries]
+        self.automaton = AhoCorasick(self.words)
+
+    def __len__(self):
+        return len(self.words)
+
+    def message_for(self, pattern_id):
+        if self.messages[pattern_id]:
+            return self.messages[pattern_id]
+        word = self.words[pattern_id]
+        if self.is_ng:
+            return f"「{word}」はNGワードです ({self.name})"
+        return f"「{word}」は「{self.corrections[pattern_id]}」と表記してください ({self.name})"
+
+    def check(self, text, line_starts, first_line=1):
+        # line_starts は rule_engine.LineIndex の行頭オフセット
+        results = []
+        for start, pattern_id in self.automaton.find_all(text):
+            line_idx = bisect_right(line_starts, start) - 1
+            result = {
+                'type': 'NGワード' if self.is_ng else '表記統一',
+                'line': line_idx + first_line,
+                'position': start - line_starts[line_idx],
+                'text': self.words[pattern_id],
+                'message': self.message_for(pattern_id),
+                'severity': 'error' if self.is_ng else 'suggestion',
+            }
+            # 表記辞書の「正」は、そのまま自動修正の置換後の文字列になる
+            if not self.is_ng and self.corrections[pattern_id]:
+                result['replacement'] = self.corrections[pattern_id]
+            results.append(result)
+        return results
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def load_dictionary(path, cache_dir=None):
+    # キャッシュが元ファイルと同じ (更新時刻・サイズ・形式バージョン) なら、コンパイルせずに読み込む。
+    # ファイルが読めなければ DictionaryError を送出する
+    name = os.path.basename(path)
+    is_ng = '.ng.' in name
+    signature = _file_signature(path)
+    version = hashlib.sha256(f"{os.path.abspath(path)}:{signature}".encode('utf-8')).hexdigest()[:12]
+    cache_path = None
+    if cache_dir:
+        cache_path = os.path.join(cache_dir, hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:16] + '.pickle')
+        try:
+            with open(cache_path, 'rb') as f:
+                header, dictionary = pickle.load(f)
+            if header == (CACHE_FORMAT_VERSION, signature):
+                return dictionary
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError, AttributeError):
+            pass
+
+    entries, warnings = _read_entries(path, is_ng)
+    dictionary = UserDictionary(name, entries, is_ng, version, warnings)
+    if cache_path:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(((CACHE_FORMAT_VERSION, signature), dictionary), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+    return dictionary
+
+
+class DictionaryRegistry:
+    # 辞書ディレクトリ (または個別ファイル) を監視し、変更されたファイルだけを読み直す
+    def __init__(self, paths, cache_dir=None):
+        self.paths = [paths] if isinstance(paths, str) else list(paths)
+        self.cache_dir = cache_dir
+        self._loaded = {}
+        # 読めなかったファイル {パス: (更新時刻とサイズ, エラー)}。ファイルが変わるまで読み直さない
+        self._failed = {}
+        self._lock = threading.Lock()
+        self.dictionaries = []
+
+    def _source_files(self):
+        files = []
+        for path in self.paths:
+            if os.path.isdir(path):
+                files.extend(os.path.join(path, name) for name in sorted(os.listdir(path))
+                             if name.endswith(DICTIONARY_EXTENSIONS))
+            elif os.path.isfile(path):
+                files.append(path)
+        return files
+
+    def refresh(self):
+        # 変更のあったファイルだけ読み直し、辞書のリストを丸ごと差し替える (読めないファイルは除く)
+        with self._lock:
+            loaded = {}
+            failed = {}
+            for path in self._source_files():
+                try:
+                    signature = _file_signature(path)
+                except OSError:
+                    # 一覧を取ってから消されたファイル
+                    continue
+                current = self._loaded.get(path)
+                if current is not None and current[0] == signature:
+                    loaded[path] = current
+                elif path in self._failed and self._failed[path][0] == signature:
+                    failed[path] = self._failed[path]
+                else:
+                    try:
+                        loaded[path] = (signature, load_dictionary(path, self.cache_dir))
+                    except DictionaryError as e:
+                        failed[path] = (signature, str(e))
+            self._loaded = loaded
+            self._failed = failed
+            self.dictionaries = [dictionary for _, dictionary in loaded.values()]
+            return self.dictionaries
+
+    def version(self):
+        return tuple(dictionary.version for dictionary in self.dictionaries)
+
+    def problems(self):
+        # 読めなかったファイルと、読み飛ばした項目の警告をメッセージのリストで返す
+        with self._lock:
+            messages = [f"{os.path.basename(path)} を読み込めませんでした: {error}" for path, (_, error) in self._failed.items()]
+            for dictionary in self.dictionaries:
+                messages.extend(f"{dictionary.name} {warning}" for warning in dictionary.warnings)
+                if dictionary.skipped_entries > len(dictionary.warnings):
+                    messages.append(f"{dictionary.name} ほか {dictionary.skipped_entries - len(dictionary.warnings)} 件の項目を読み飛ばしました")
+        return messages